@@ -1,3 +1,8 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -7,7 +12,8 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import schemas
 import models
@@ -18,10 +24,72 @@ SECRET_KEY = "your-secret-key" # TODO: Change this to a strong secret key from e
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor for new hashes; existing hashes verify at whatever cost they were made with
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+class Principal:
+    """The authenticated user as endpoints see it: just what authorization needs."""
+
+    def __init__(self, id: int, email: str, name: Optional[str], is_active: bool, is_admin: bool):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.is_active = is_active
+        self.is_admin = is_admin
+
+class PrincipalCache:
+    """
+    Bounded LRU from bearer token to Principal, so a session's repeated requests
+    skip the JWT decode and the user lookup. Entries live for at most ttl_seconds
+    and never past the token's own expiry. Changes to a user must call
+    invalidate_user(); other worker processes see them once their entries expire.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # token -> (expires_at, principal)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is not None and time.time() < entry[0]:
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[token]
+        self.misses += 1
+        return None
+
+    def put(self, token: str, principal: Principal, token_expires_at: float):
+        if self.max_entries <= 0:
+            return
+        self._entries[token] = (min(time.time() + self.ttl_seconds, token_expires_at), principal)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        # A scan, but users only change through rare admin and account actions
+        for token in [token for token, (_, principal) in self._entries.items() if principal.id == user_id]:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl_seconds": self.ttl_seconds, "hits": self.hits, "misses": self.misses}
+
+principal_cache = PrincipalCache(
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000")), # 0 disables the cache
+    ttl_seconds=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -31,6 +99,56 @@ def get_password_hash(password: str) -> str:
     truncated_password = password.encode('utf-8')[:72].decode('utf-8', 'ignore')
     return pwd_context.hash(truncated_password)
 
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool (bcrypt releases the GIL while hashing),
+    so a login storm queues here instead of stalling the event loop for every other
+    request. At most max_pending calls may be running or queued; beyond that
+    requests are shed with a 503 rather than waiting behind the whole storm.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins at once. Please try again in a moment.",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending, "rejected": self.rejected, "bcrypt_rounds": BCRYPT_ROUNDS}
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")), # Hashes running or queued before shedding
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -41,7 +159,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,12 +177,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         token_data = schemas.TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).options(joinedload(models.User.lesson_completions)).filter(models.User.email == token_data.email).first()
+    # Only the columns endpoints use to authorize; completions are loaded by the endpoints that return them
+    result = await db.execute(select(models.User.id, models.User.email, models.User.name, models.User.is_active, models.User.is_admin).where(models.User.email == token_data.email))
+    user = result.first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal(user.id, user.email, user.name, user.is_active, user.is_admin)
+    principal_cache.put(token, principal, payload.get("exp", 0)) # Tokens without an expiry aren't cached
+    return principal
 
-async def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,79 @@
+"""
+Compares the old blocking Session path with the AsyncSession path under concurrent
+requests. Every query is slowed down by a SQLite function that sleeps, standing
+in for a slow Postgres query, and a heartbeat task measures how long the event
+loop is stalled while the queries run.
+
+    python benchmarks/db_concurrency.py [--requests 50] [--query-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import models
+
+def _install_sleep(engine, query_ms):
+    @event.listens_for(engine, "connect")
+    def register(dbapi_connection, _):
+        dbapi_connection.create_function("bench_sleep", 0, lambda: time.sleep(query_ms / 1000) or 0)
+
+async def _heartbeat(stop, lags):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+async def _measure(handle_request, requests):
+    stop, lags = asyncio.Event(), []
+    heartbeat = asyncio.ensure_future(_heartbeat(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(handle_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heartbeat
+    return elapsed, max(lags or [0.0])
+
+async def main(requests, query_ms):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    sync_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    _install_sleep(sync_engine, query_ms)
+    _install_sleep(async_engine.sync_engine, query_ms)
+    models.Base.metadata.create_all(sync_engine)
+    with sessionmaker(bind=sync_engine)() as db: # The slow condition is evaluated per row
+        db.add(models.Lesson(title="Benchmark", content=""))
+        db.commit()
+    query = select(models.Lesson).where(func.bench_sleep() == 0)
+
+    SyncSession = sessionmaker(bind=sync_engine)
+    AsyncSession = async_sessionmaker(async_engine)
+
+    async def sync_request(): # What the endpoints did before: a blocking query inside `async def`
+        with SyncSession() as db:
+            db.execute(query).all()
+
+    async def async_request():
+        async with AsyncSession() as db:
+            (await db.execute(query)).all()
+
+    for name, handler in (("sync Session", sync_request), ("AsyncSession", async_request)):
+        elapsed, max_lag = await _measure(handler, requests)
+        print(f"{name:>13}: {requests} concurrent requests in {elapsed * 1000:7.1f} ms "
+              f"({requests / elapsed:6.1f} req/s), longest event loop stall {max_lag * 1000:6.1f} ms")
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--query-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.query_ms))
@@ -0,0 +1,76 @@
+"""
+Measures a login storm with bcrypt run inline on the event loop (as the login
+and signup endpoints used to) against bcrypt on the bounded thread pool. While
+the logins run, a steady stream of cheap "other" requests measures how long
+everything else waits, reported as p50/p99 latency.
+
+    python benchmarks/password_hashing.py [--logins 40] [--rounds 12] [--workers 4]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from passlib.context import CryptContext
+
+import auth
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+async def _other_requests(stop, latencies, interval=0.005):
+    """
+    Requests arriving every interval that need no CPU of their own, so their
+    latency (from arrival to being handled) is pure time waiting for the event loop.
+    """
+    due = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        latencies.append(time.perf_counter() - due)
+        due += interval
+
+async def _measure(login, logins):
+    stop, latencies = asyncio.Event(), []
+    other = asyncio.ensure_future(_other_requests(stop, latencies))
+    await asyncio.sleep(0.05) # Baseline samples before the storm
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await other
+    succeeded = sum(1 for result in results if result is True)
+    return elapsed, succeeded, latencies
+
+async def main(logins, rounds, workers, max_pending):
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hashed = context.hash("correct horse battery staple")
+    auth.pwd_context = context # verify_password uses the module's context
+    hasher = auth.PasswordHasher(workers=workers, max_pending=max_pending)
+
+    async def inline_login():
+        return auth.verify_password("correct horse battery staple", hashed)
+
+    async def pooled_login():
+        return await hasher.verify("correct horse battery staple", hashed)
+
+    print(f"{logins} concurrent logins, bcrypt cost {rounds}, {workers} hashing threads, queue limit {max_pending}")
+    for name, login in (("inline", inline_login), ("thread pool", pooled_login)):
+        elapsed, succeeded, latencies = await _measure(login, logins)
+        print(f"{name:>11}: {succeeded} logins in {elapsed * 1000:7.1f} ms ({succeeded / elapsed:5.1f} logins/s), "
+              f"{logins - succeeded} shed; other requests p50 {statistics.median(latencies) * 1000:6.2f} ms, "
+              f"p99 {_percentile(latencies, 99) * 1000:7.2f} ms, max {max(latencies) * 1000:7.2f} ms")
+    hasher.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.rounds, args.workers, args.max_pending))
@@ -0,0 +1,182 @@
+"""
+Writes to user_lesson_completions, the most written table. Every write is a single
+INSERT ... ON CONFLICT (user_id, lesson_id) DO UPDATE ... RETURNING, so a
+first write and a repeat cost one round trip, and a double submit can't race
+into a primary key violation the way select-then-insert could.
+
+Progress recorded after code runs goes through ProgressWriter instead: it is
+written behind the response, with repeated runs of a lesson coalesced and all
+pending lessons flushed in one multi-row upsert per transaction.
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert} # Both spell ON CONFLICT the same way
+
+def _insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f"Completion upserts are not supported on {dialect}")
+    return _INSERTS[dialect](models.UserLessonCompletion)
+
+async def upsert_completion(db: AsyncSession, user_id: int, lesson_id: int, values: dict, update: Optional[dict] = None) -> Optional[models.UserLessonCompletion]:
+    """
+    Inserts the completion with values, or applies update (default: values) to the
+    existing row, and returns the row as stored. An empty update leaves an existing
+    row untouched, without writing it, and returns None in that case. Doesn't commit.
+    """
+    statement = _insert(db).values(user_id=user_id, lesson_id=lesson_id, **values)
+    index_elements = [models.UserLessonCompletion.user_id, models.UserLessonCompletion.lesson_id]
+    if update == {}:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    else:
+        statement = statement.on_conflict_do_update(index_elements=index_elements, set_=values if update is None else update)
+    # populate_existing: a row already in the session takes the values just written
+    return await db.scalar(statement.returning(models.UserLessonCompletion), execution_options={"populate_existing": True})
+
+class ProgressWriter:
+    """
+    Write-behind buffer for the last attempted code and status of each (user, lesson).
+    Only the latest attempt per lesson is kept until the next flush, which happens
+    every flush_interval seconds. A run is therefore persisted at most about
+    flush_interval seconds after its response; stop() flushes what is left. If
+    max_pending lessons are waiting, record() flushes inline instead of growing.
+    """
+
+    def __init__(self, session_factory: Callable, flush_interval: float, max_pending: int, batch_size: int = 500):
+        self.session_factory = session_factory # Returns an async context manager yielding an AsyncSession
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending: Dict[Tuple[int, int], dict] = {}
+        self._pending_users = Counter() # user_id -> lessons pending
+        self._writing_users = set() # Users with rows in the flush now running
+        self._lock = None # Serializes flushes
+        self._task = None
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+
+    async def record(self, user_id: int, lesson_id: int, code: str, status: str):
+        key = (user_id, lesson_id)
+        previous = self._pending.get(key)
+        if previous is None:
+            self._pending_users[user_id] += 1
+        # A success stays recorded as a completion even if a later run in the same window fails
+        completed_at = datetime.now(timezone.utc) if status == "success" else (previous or {}).get("completed_at")
+        self._pending[key] = {
+            "user_id": user_id, "lesson_id": lesson_id, "last_attempted_code": code, "status": status,
+            "completed_at": completed_at, "last_attempted_at": datetime.now(timezone.utc),
+        }
+        self.recorded += 1
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending, self._pending_users = list(self._pending.values()), {}, Counter()
+            self._writing_users = {row["user_id"] for row in rows}
+            try:
+                async with self.session_factory() as db:
+                    for start in range(0, len(rows), self.batch_size):
+                        await self._write(db, rows[start:start + self.batch_size])
+                    await db.commit()
+            except Exception as e:
+                self.failures += 1
+                print(f"Error writing lesson progress, retrying row by row: {e}", file=sys.stderr)
+                await self._write_rows_individually(rows)
+                return
+            finally:
+                self._writing_users = set()
+            self.flushes += 1
+            self.written += len(rows)
+
+    async def _write_rows_individually(self, rows):
+        """Keeps one bad row (e.g. for a user deleted meanwhile) from failing every flush after it."""
+        for index, row in enumerate(rows):
+            try:
+                async with self.session_factory() as db:
+                    await self._write(db, [row])
+                    await db.commit()
+            except IntegrityError as e:
+                print(f"Dropping lesson progress for user {row['user_id']}, lesson {row['lesson_id']}: {e}", file=sys.stderr)
+            except Exception:
+                # Not this row's fault (the database is likely unavailable): retry the rest on the next flush
+                for row in rows[index:]:
+                    key = (row["user_id"], row["lesson_id"])
+                    if key not in self._pending: # Unless a newer attempt replaced it
+                        self._pending[key] = row
+                        self._pending_users[row["user_id"]] += 1
+                return
+            else:
+                self.written += 1
+
+    async def flush_user(self, user_id: int):
+        """
+        Writes pending progress now if user_id has any, so that reads of their progress
+        see it and direct writes to it aren't overwritten by an older queued attempt.
+        If a flush is already writing their rows, waits for it to commit.
+        """
+        if self._pending_users.get(user_id) or user_id in self._writing_users:
+            await self.flush() # Takes the lock, so it runs after the flush in progress
+
+    async def _write(self, db, rows):
+        statement = _insert(db).values([{**row, "notes": None, "bookmarked": False} for row in rows])
+        last_attempted_at = models.UserLessonCompletion.last_attempted_at
+        statement = statement.on_conflict_do_update(
+            index_elements=[models.UserLessonCompletion.user_id, models.UserLessonCompletion.lesson_id],
+            set_={
+                "last_attempted_code": statement.excluded.last_attempted_code,
+                "status": statement.excluded.status,
+                "completed_at": func.coalesce(statement.excluded.completed_at, models.UserLessonCompletion.completed_at),
+                "last_attempted_at": statement.excluded.last_attempted_at,
+            },
+            # flush_user only orders writes within this process; a newer write from another one wins
+            where=last_attempted_at.is_(None) | (last_attempted_at <= statement.excluded.last_attempted_at),
+        )
+        await db.execute(statement)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush()) # stop() must not cancel a flush halfway and lose its rows
+
+    def start(self):
+        self._lock = asyncio.Lock() # Bound to the running event loop
+        self._task = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "flush_interval_seconds": self.flush_interval,
+            "recorded": self.recorded,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,112 @@
+"""
+Per-request database instrumentation. Engine events count the statements a
+request runs and the time spent in them; the same statement text running many
+times in one request (the N+1 shape, e.g. a relationship loaded once per row)
+is reported, and slow statements are logged with their query plan.
+
+Only a sample of requests is instrumented (DB_INSTRUMENTATION_SAMPLE_RATE,
+off by default); for the rest, each statement costs one context variable lookup.
+"""
+import contextvars
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+
+SAMPLE_RATE = float(os.getenv("DB_INSTRUMENTATION_SAMPLE_RATE", "0")) # 0 disables, 1 instruments every request
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5")) # Runs of one statement in a request
+EXPLAIN_SLOW_QUERIES = os.getenv("DB_EXPLAIN_SLOW_QUERIES", "true").lower() == "true"
+
+def _log(message: str):
+    print(f"[db] {message}", file=sys.stderr)
+
+class RequestQueryStats:
+    def __init__(self):
+        self.query_count = 0
+        self.total_seconds = 0.0
+        self.statements = Counter() # statement text -> executions
+        self.slow_statements = []
+
+    def record(self, statement: str, seconds: float):
+        self.query_count += 1
+        self.total_seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated_statements(self, threshold: int = None):
+        """Statements run at least threshold times, most repeated first."""
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+_current_stats: contextvars.ContextVar[Optional[RequestQueryStats]] = contextvars.ContextVar("db_request_stats", default=None)
+
+def _explain(conn, statement: str, parameters) -> str:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    token = _current_stats.set(None) # Keep the EXPLAIN itself out of the request's numbers
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+    finally:
+        _current_stats.reset(token)
+    return "\n".join("    " + " ".join(str(column) for column in row) for row in rows)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        conn.info["query_started"] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    seconds = time.perf_counter() - conn.info["query_started"]
+    stats.record(statement, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        stats.slow_statements.append(statement)
+        message = f"Slow statement ({seconds * 1000:.1f} ms): {statement}"
+        if EXPLAIN_SLOW_QUERIES and not executemany and statement.lstrip().upper().startswith("SELECT"):
+            message += "\n" + _explain(conn, statement, parameters)
+        _log(message)
+
+def install(engine):
+    """Attaches the listeners to an Engine (for an AsyncEngine, pass engine.sync_engine)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class InstrumentRequests:
+    """
+    ASGI middleware: instruments a sample of requests and reports what they ran.
+    Plain ASGI rather than an http middleware, so unsampled requests (and streamed
+    responses) pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestQueryStats()
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                # Sent once the endpoint has returned and its result is serialized, where lazy loads would run
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-query-count", str(stats.query_count).encode("latin-1")),
+                    (b"x-db-time-ms", f"{stats.total_seconds * 1000:.1f}".encode("latin-1")),
+                ]
+            await send(message)
+
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current_stats.reset(token)
+        for statement, count in stats.repeated_statements():
+            _log(f"Possible N+1 in {scope['method']} {scope['path']}: ran {count} times: {statement}")
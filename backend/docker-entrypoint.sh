@@ -1,5 +1,9 @@
 #!/bin/sh
 
+# Add columns and indexes introduced since the tables were created; the app itself only creates missing tables
+echo "Running migrate_schema.py..."
+python migrate_schema.py || exit 1
+
 # Run create_lessons.py if RUN_CREATE_LESSONS environment variable is set to 'true'
 if [ "$RUN_CREATE_LESSONS" = "true" ]; then
   echo "Running create_lessons.py..."
@@ -0,0 +1,109 @@
+"""
+In-memory store for asynchronous code execution jobs. A submitted job gets an id
+straight away and is graded by a background task; clients poll (or long-poll)
+for the result. Finished jobs are kept for a limited time, and the number of
+unfinished jobs is bounded so a burst is rejected instead of piling up.
+
+Jobs live in the memory of the worker process that accepted them, so a job id
+only resolves on that worker: with several workers (uvicorn --workers, or
+replicas behind a load balancer) polls must be routed back to the same process,
+e.g. with sticky sessions, or they get a 404. Jobs are also lost on restart.
+"""
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+class JobQueueFull(Exception):
+    pass
+
+class ExecutionJob:
+    def __init__(self, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = "queued" # queued -> running -> done | failed
+        self.result = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self._finished = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._finished.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+class ExecutionJobStore:
+    """
+    Runs job coroutines at most max_running at a time; at most max_pending jobs may
+    be unfinished. Finished jobs are forgotten result_ttl seconds after they end.
+    """
+
+    def __init__(self, max_running: int, max_pending: int, result_ttl: float):
+        self.max_running = max_running
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, ExecutionJob] = {}
+        self._tasks = set()
+        self._slots = None
+        self._last_prune = 0.0
+        self.pending = 0
+
+    def submit(self, user_id: int, work: Callable[[], Awaitable]) -> ExecutionJob:
+        """Starts work() in the background; its return value becomes the job's result."""
+        self._prune()
+        if self.pending >= self.max_pending:
+            raise JobQueueFull("Too many code runs are queued. Please try again shortly.")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+
+        job = ExecutionJob(user_id)
+        self._jobs[job.id] = job
+        self.pending += 1
+        task = asyncio.ensure_future(self._run(job, work))
+        self._tasks.add(task) # Keep a reference until it finishes
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Optional[ExecutionJob]:
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None # Other users' jobs are indistinguishable from missing ones
+        return job
+
+    async def _run(self, job: ExecutionJob, work):
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.result = await work()
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = getattr(e, "detail", None) or str(e) or type(e).__name__
+        finally:
+            self.pending -= 1
+            job.finished_at = time.monotonic()
+            job._finished.set()
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < 1.0:
+            return # At most once a second, however fast jobs are submitted
+        self._last_prune = now
+        cutoff = now - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def shutdown(self):
+        """Lets running jobs finish (so their results are persisted) before the process exits."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"jobs": len(self._jobs), "pending": self.pending, "max_pending": self.max_pending, "max_running": self.max_running}
@@ -1,16 +1,82 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import subprocess
 import os
-import tempfile
+import sys
+import json
+import socket
+import struct
+import signal
 import asyncio
-from typing import Optional # Import Optional
+import codecs
+import math
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional # Import Optional
+
+import executor_sandbox
+import executor_metrics
+from executor_cache import ResultCache, SourceCache, is_deterministic, result_key, source_hash
+
+# Fork-server configuration. When enabled, user code runs in children forked from a
+# warm "zygote" process instead of a fresh `python` interpreter per run.
+EXECUTOR_USE_FORKSERVER = os.getenv("EXECUTOR_USE_FORKSERVER", "true").lower() == "true"
+EXECUTOR_MAX_CHILDREN = int(os.getenv("EXECUTOR_MAX_CHILDREN", str(os.cpu_count() or 1)))
+EXECUTOR_LINT_WORKERS = int(os.getenv("EXECUTOR_LINT_WORKERS", "2"))
+
+# Admission control: at most EXECUTOR_MAX_CONCURRENT runs at once, at most
+# EXECUTOR_MAX_QUEUE requests waiting, each for at most EXECUTOR_MAX_QUEUE_WAIT seconds.
+EXECUTOR_MAX_CONCURRENT = int(os.getenv("EXECUTOR_MAX_CONCURRENT", str(EXECUTOR_MAX_CHILDREN)))
+EXECUTOR_MAX_QUEUE = int(os.getenv("EXECUTOR_MAX_QUEUE", str(EXECUTOR_MAX_CONCURRENT * 4)))
+EXECUTOR_MAX_QUEUE_WAIT = float(os.getenv("EXECUTOR_MAX_QUEUE_WAIT", "5"))
+
+# Batch execution: the most jobs one /execute/batch call may carry, and how many of
+# them run at once. Batch jobs take the same admission slots as interactive runs, so
+# the rest of EXECUTOR_MAX_CONCURRENT stays free for interactive runs.
+EXECUTOR_MAX_BATCH_SIZE = int(os.getenv("EXECUTOR_MAX_BATCH_SIZE", "1000"))
+EXECUTOR_BATCH_CONCURRENCY = int(os.getenv("EXECUTOR_BATCH_CONCURRENCY", str(max(1, EXECUTOR_MAX_CHILDREN // 2))))
+
+# Per-run limits. Output beyond the byte caps is dropped and the run is stopped;
+# the rest are applied to each child with setrlimit. 0 disables a limit.
+EXECUTOR_MAX_STDOUT_BYTES = int(os.getenv("EXECUTOR_MAX_STDOUT_BYTES", str(256 * 1024)))
+EXECUTOR_MAX_STDERR_BYTES = int(os.getenv("EXECUTOR_MAX_STDERR_BYTES", str(64 * 1024)))
+EXECUTOR_CPU_LIMIT_SECONDS = int(os.getenv("EXECUTOR_CPU_LIMIT_SECONDS", "10"))
+EXECUTOR_MEMORY_LIMIT_MB = int(os.getenv("EXECUTOR_MEMORY_LIMIT_MB", "256"))
+EXECUTOR_FILE_SIZE_LIMIT_MB = int(os.getenv("EXECUTOR_FILE_SIZE_LIMIT_MB", "1"))
+RUN_LIMITS = {
+    "cpu_seconds": EXECUTOR_CPU_LIMIT_SECONDS,
+    "address_space_bytes": EXECUTOR_MEMORY_LIMIT_MB * 1024 * 1024,
+    "file_size_bytes": EXECUTOR_FILE_SIZE_LIMIT_MB * 1024 * 1024,
+}
+
+# Result cache configuration. Set EXECUTOR_CACHE_SIZE=0 to disable caching.
+EXECUTOR_CACHE_SIZE = int(os.getenv("EXECUTOR_CACHE_SIZE", "1024"))
+EXECUTOR_CACHE_TTL = int(os.getenv("EXECUTOR_CACHE_TTL", "3600")) # seconds
+EXECUTOR_CACHE_DIR = os.getenv("EXECUTOR_CACHE_DIR") # Optional on-disk persistence
+RUNTIME_VERSION = f"{sys.version}|harness-{executor_sandbox.HARNESS_VERSION}"
+
+# Test sources remembered by hash (the zygote keeps the compiled code for the same hashes)
+EXECUTOR_TEST_CACHE_SIZE = executor_sandbox.COMPILED_TEST_CACHE_SIZE
 
 app = FastAPI()
 
+# Prometheus metrics served at /metrics (gauges are registered with the objects they read)
+metrics = executor_metrics.Registry()
+PHASE_SECONDS = metrics.register(executor_metrics.Histogram(
+    "executor_phase_seconds", "Time spent in each phase of a run: spawn, lint, user and test.", ("phase",)))
+QUEUE_WAIT_SECONDS = metrics.register(executor_metrics.Histogram(
+    "executor_queue_wait_seconds", "Time admitted requests waited for an execution slot."))
+RUNS_TOTAL = metrics.register(executor_metrics.Counter(
+    "executor_runs_total", "Finished runs by outcome: success, assertion, timeout, limit or error.", ("outcome",)))
+
 class CodeExecutionRequest(BaseModel):
     user_code: str
     test_code: Optional[str] = None
+    test_hash: Optional[str] = None # sha256 of test_code; may be sent alone once the executor has seen the source
     timeout: int = 5 # seconds
     language: str = "python" # Add language field with default
 
@@ -19,153 +85,704 @@ class CodeExecutionResult(BaseModel):
     stderr: str
     returncode: int
     error: Optional[str] = None
+    linter_output: Optional[str] = None
+
+class BatchExecutionRequest(BaseModel):
+    jobs: List[CodeExecutionRequest]
+    stream: bool = False # Stream results as NDJSON in completion order instead of one ordered list
+
+class BatchExecutionResult(BaseModel):
+    results: List[CodeExecutionResult] # In the same order as the request's jobs
+
+class RunOutcome(BaseModel):
+    phase: str = "user" # "user" or "test": the part of the job that ran last
+    stdout: str = ""
+    stderr: str = ""
+    returncode: int = 0
+    timed_out: bool = False
+    limit_exceeded: Optional[str] = None # "output" or "cpu" if the run was stopped by a limit
+    exit_status: Optional[int] = None # The child's real exit status, where the fork server reported it
+    error: Optional[str] = None
+    # Timings for /metrics; unset if the child was killed before reporting them
+    spawn_seconds: Optional[float] = None
+    user_seconds: Optional[float] = None
+    test_seconds: Optional[float] = None
+
+
+# --- Executor side ---
+
+class ForkServer:
+    """
+    Supervises the zygote process: starts it on demand, restarts it if it dies and
+    caps the number of children running at once.
+    """
+
+    def __init__(self, max_children: int):
+        self.max_children = max_children
+        self._process = None
+        self._sock = None
+        self._spawn_lock = threading.Lock()
+        self._slots = None
+        self.active_children = 0
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._process = subprocess.Popen(
+            [sys.executable, executor_sandbox.__file__, "--zygote", str(child_sock.fileno())],
+            pass_fds=(child_sock.fileno(),),
+            stdin=subprocess.DEVNULL,
+        )
+        child_sock.close()
+        self._sock = parent_sock
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def _spawn(self, job, fds) -> int:
+        payload = json.dumps(job).encode("utf-8")
+        with self._spawn_lock:
+            if not self.running:
+                self.stop()
+                self.start()
+            socket.send_fds(self._sock, [struct.pack("!I", len(payload))], fds)
+            self._sock.sendall(payload)
+            (pid,) = struct.unpack("!i", executor_sandbox.recv_exactly(self._sock, 4))
+        return pid
+
+    async def run(self, job: dict, timeout: int, on_output=None) -> RunOutcome:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_children)
+        async with self._slots:
+            self.active_children += 1
+            try:
+                return await self._run(job, timeout, on_output)
+            finally:
+                self.active_children -= 1
+
+    async def _run(self, job, timeout, on_output):
+        loop = asyncio.get_running_loop()
+        stdin_fd = os.open(os.devnull, os.O_RDONLY)
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        status_r, status_w = os.pipe()
+        child_fds = [stdin_fd, stdout_w, stderr_w, status_w]
+        spawn_started = time.monotonic()
+        spawn = loop.run_in_executor(None, self._spawn, job, child_fds)
+        try:
+            # Shielded: if the caller is cancelled the thread may still be sending child_fds,
+            # and closing them early would let another job's os.pipe() reuse their numbers
+            pid = await asyncio.shield(spawn)
+        except BaseException:
+            for fd in (stdout_r, stderr_r, status_r):
+                os.close(fd)
+            spawn.add_done_callback(lambda _: _release_spawn(spawn, child_fds, kill=True))
+            raise
+        _release_spawn(spawn, child_fds, kill=False)
+        spawn_seconds = time.monotonic() - spawn_started
+        outcome = await _collect_run(pid, stdout_r, stderr_r, status_r, timeout, on_output)
+        outcome.spawn_seconds = spawn_seconds
+        return outcome
+
+def _release_spawn(spawn, child_fds, kill: bool):
+    """Closes the child's ends of its pipes once the spawn thread is done with them, killing the child if asked."""
+    for fd in child_fds:
+        os.close(fd)
+    if kill and not spawn.cancelled() and spawn.exception() is None:
+        _kill_process_group(spawn.result()) # Nobody will read its pipes, so it would block once they fill
+
+async def _open_pipe_reader(pipe):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe
+    )
+    return reader, transport
+
+def _kill_process_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, signal.SIGKILL) # A just-forked child may not have called setsid() yet
+        except (ProcessLookupError, PermissionError):
+            pass
+
+async def _read_stream(reader, name, chunks, on_output, max_bytes, on_limit):
+    """
+    Reads a pipe to EOF, keeping at most max_bytes (0 for no cap). Past the cap a
+    truncation marker is added, on_limit() is called once and the rest is discarded.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("replace") # Chunks may split a character
+    kept = 0
+    truncated = False
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk:
+            break
+        if truncated:
+            continue
+        if max_bytes and kept + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - kept] + f"\n... [{name} truncated after {max_bytes} bytes]\n".encode("utf-8")
+            truncated = True
+            on_limit()
+        kept += len(chunk)
+        chunks.append(chunk)
+        if on_output is not None:
+            text = decoder.decode(chunk)
+            if text:
+                on_output(name, text)
+
+async def _collect_run(pid, stdout_fd, stderr_fd, status_fd, timeout, on_output=None) -> RunOutcome:
+    """
+    Reads a child's stdout, stderr and status pipes until it exits, killing its
+    process group if it runs past the timeout, writes more than the output caps
+    or the caller goes away. Output is passed to on_output(stream_name, text) as
+    it arrives.
+    """
+    outcome = RunOutcome()
+    stdout_chunks, stderr_chunks, status_chunks = [], [], []
+
+    def on_output_limit():
+        if outcome.limit_exceeded is None:
+            outcome.limit_exceeded = "output"
+            _kill_process_group(pid)
+
+    # Wrapped up front so the finally below closes every pipe, even if cancelled while opening readers
+    pipes = [os.fdopen(fd, "rb", 0) for fd in (stdout_fd, stderr_fd, status_fd)]
+    readers = []
+    reads = None
+    try:
+        for pipe in pipes:
+            readers.append(await _open_pipe_reader(pipe))
+        reads = asyncio.gather(
+            _read_stream(readers[0][0], "stdout", stdout_chunks, on_output, EXECUTOR_MAX_STDOUT_BYTES, on_output_limit),
+            _read_stream(readers[1][0], "stderr", stderr_chunks, on_output, EXECUTOR_MAX_STDERR_BYTES, on_output_limit),
+            _read_stream(readers[2][0], "status", status_chunks, None, 0, None),
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(reads), timeout=timeout)
+        except asyncio.TimeoutError:
+            _kill_process_group(pid)
+            outcome.timed_out = True
+            try:
+                await asyncio.wait_for(reads, timeout=5)
+            except asyncio.TimeoutError:
+                pass # Something outside the process group is still holding the pipes open
+    except asyncio.CancelledError:
+        _kill_process_group(pid)
+        if reads is not None:
+            reads.cancel()
+        raise
+    finally:
+        for _, transport in readers:
+            transport.close()
+        for pipe in pipes:
+            pipe.close()
+
+    outcome.stdout = b"".join(stdout_chunks).decode("utf-8", "replace")
+    outcome.stderr = b"".join(stderr_chunks).decode("utf-8", "replace")
+    reported = None
+    for line in b"".join(status_chunks).decode("utf-8").splitlines():
+        event = json.loads(line)
+        outcome.phase = event.get("phase", outcome.phase)
+        reported = event.get("returncode", reported)
+        outcome.exit_status = event.get("exit_status", outcome.exit_status)
+        outcome.limit_exceeded = event.get("limit", outcome.limit_exceeded)
+        outcome.user_seconds = event.get("user_seconds", outcome.user_seconds)
+        outcome.test_seconds = event.get("test_seconds", outcome.test_seconds)
+    if reported is not None:
+        outcome.returncode = reported
+    elif outcome.exit_status is not None:
+        outcome.returncode = outcome.exit_status # Exited without reporting, e.g. through os._exit()
+    else:
+        outcome.returncode = -signal.SIGKILL # Killed before reporting (or its exit status isn't known yet)
+    if outcome.timed_out:
+        outcome.returncode = -1
+    return outcome
+
+class ExecutorOverloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Limits how many runs execute at once. Requests beyond the limit wait in a
+    bounded queue for a bounded time; past that they are rejected immediately so
+    a burst can't oversubscribe the CPU and time out every run together.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_wait_timeout = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._average_run_seconds = 1.0 # Moving average used for Retry-After
+        self.batch_active = 0
+        self.batch_waiting = 0
+        self._slots = None
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(backlog * self._average_run_seconds))
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise ExecutorOverloaded("Execution queue is full", self.retry_after())
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected_wait_timeout += 1
+            raise ExecutorOverloaded(f"Timed out after {self.max_wait:g}s waiting for an execution slot", self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        QUEUE_WAIT_SECONDS.observe(waited)
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.admitted += 1
+        self.active += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        self.active -= 1
+        self._slots.release()
+        self._average_run_seconds = 0.9 * self._average_run_seconds + 0.1 * (time.monotonic() - admitted_at)
+
+    async def acquire_batch_slot(self):
+        """
+        Takes a slot for one job of an accepted batch. Batch jobs wait without the
+        queue bound or the timeout, and aren't counted in the interactive queue.
+        Callers bound how many of their jobs wait at once.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        self.batch_waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.batch_waiting -= 1
+        self.active += 1
+        self.batch_active += 1
+
+    def release_batch_slot(self):
+        # Not folded into the run time average: that estimates interactive waits for Retry-After
+        self.active -= 1
+        self.batch_active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_queue_wait_seconds": self.max_wait,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_wait_timeout": self.rejected_wait_timeout,
+            "average_wait_seconds": self.total_wait_seconds / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "average_run_seconds": self._average_run_seconds,
+            "batch_active": self.batch_active,
+            "batch_waiting": self.batch_waiting,
+        }
+
+def _overloaded_response(e: ExecutorOverloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+fork_server = ForkServer(max_children=EXECUTOR_MAX_CHILDREN)
+admission = AdmissionController(EXECUTOR_MAX_CONCURRENT, EXECUTOR_MAX_QUEUE, EXECUTOR_MAX_QUEUE_WAIT)
+result_cache = ResultCache(EXECUTOR_CACHE_SIZE, EXECUTOR_CACHE_TTL, EXECUTOR_CACHE_DIR)
+test_sources = SourceCache(EXECUTOR_TEST_CACHE_SIZE)
+lint_pool = None
+
+metrics.register(executor_metrics.Gauge("executor_active_runs", "Requests currently holding an execution slot.", lambda: admission.active))
+metrics.register(executor_metrics.Gauge("executor_queue_depth", "Requests waiting for an execution slot.", lambda: admission.waiting))
+metrics.register(executor_metrics.Gauge("executor_running_children", "Fork server children currently running user programs.", lambda: fork_server.active_children))
+metrics.register(executor_metrics.Gauge("executor_fork_server_up", "Whether the zygote process is alive.", lambda: fork_server.running))
+
+def _get_lint_pool() -> ProcessPoolExecutor:
+    global lint_pool
+    if lint_pool is None:
+        # Spawned workers only import executor_lint, not this (threaded) server process
+        lint_pool = ProcessPoolExecutor(
+            max_workers=EXECUTOR_LINT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return lint_pool
+
+@app.on_event("startup")
+def start_fork_server():
+    if EXECUTOR_USE_FORKSERVER:
+        fork_server.start()
+    # Warm the lint workers so the first request doesn't pay for spawning them
+    for _ in range(EXECUTOR_LINT_WORKERS):
+        _get_lint_pool().submit(int)
+
+@app.on_event("shutdown")
+def stop_fork_server():
+    global lint_pool
+    fork_server.stop()
+    if lint_pool is not None:
+        lint_pool.shutdown(cancel_futures=True)
+        lint_pool = None
+
+async def lint_code(source: str, timeout: int) -> str:
+    """Lints source with pyflakes and pycodestyle on the lint worker pool."""
+    global lint_pool
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    try:
+        import executor_lint
+        output = await asyncio.wait_for(loop.run_in_executor(_get_lint_pool(), executor_lint.lint_python, source), timeout=timeout)
+        PHASE_SECONDS.observe(time.monotonic() - started, "lint")
+        return output
+    except ImportError:
+        return "Linter (pyflakes/pycodestyle) not found. Please ensure it is installed in the execution environment."
+    except asyncio.TimeoutError:
+        return f"Linter timed out after {timeout} seconds."
+    except BrokenProcessPool:
+        lint_pool = None # A worker died; start a fresh pool for the next request
+        return "Error running linter: lint worker exited unexpectedly."
+    except Exception as e:
+        return f"Error running linter: {e}"
+
+async def _run_job_subprocess(job: dict, timeout: int, on_output=None) -> RunOutcome:
+    """Grades a job in a fresh interpreter (used when the fork server is off)."""
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    status_r, status_w = os.pipe()
+    spawn_started = time.monotonic()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            executor_sandbox.__file__,
+            "--run",
+            str(status_w),
+            stdin=subprocess.PIPE,
+            stdout=stdout_w,
+            stderr=stderr_w,
+            pass_fds=(status_w,),
+            start_new_session=True,
+        )
+    except BaseException:
+        for fd in (stdout_r, stderr_r, status_r):
+            os.close(fd)
+        raise
+    finally:
+        for fd in (stdout_w, stderr_w, status_w):
+            os.close(fd)
+
+    # The job is sent on stdin, so reading input() afterwards hits EOF like before
+    process.stdin.write(json.dumps(job).encode("utf-8"))
+    process.stdin.close()
+    spawn_seconds = time.monotonic() - spawn_started
+    try:
+        outcome = await _collect_run(process.pid, stdout_r, stderr_r, status_r, timeout, on_output)
+    finally:
+        await process.wait()
+    outcome.spawn_seconds = spawn_seconds
+    if outcome.exit_status is None:
+        outcome.exit_status = process.returncode
+        if outcome.returncode == -signal.SIGKILL: # Nothing was reported on the status pipe
+            outcome.returncode = process.returncode
+    return outcome
+
+async def run_job(job: dict, timeout: int, on_output=None) -> RunOutcome:
+    try:
+        if EXECUTOR_USE_FORKSERVER:
+            return await fork_server.run(job, timeout, on_output)
+        return await _run_job_subprocess(job, timeout, on_output)
+    except Exception as e:
+        return RunOutcome(returncode=1, error=f"Execution error: {e}")
 
 @app.post("/execute", response_model=CodeExecutionResult)
 async def execute_code(request: CodeExecutionRequest):
     """
     Executes Python code in a sandboxed environment.
     """
-    user_stdout = ""
-    user_stderr = ""
-    user_returncode = 0
-    user_error_message = None
-    linter_output = "" # Initialize linter output
+    request = _resolve_test_code(request)
+    cache_key, cached = _lookup_cached(request)
+    if cached is not None:
+        return CodeExecutionResult(**cached)
 
-    # --- Run Linter (Flake8) ---
-    if request.language == "python": # Only lint Python code
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".py") as user_code_file:
-            user_code_file.write(request.user_code)
-            user_code_path = user_code_file.name
+    try:
+        admitted_at = await admission.acquire()
+    except ExecutorOverloaded as e:
+        raise _overloaded_response(e)
+    try:
+        return await _execute_and_cache(request, cache_key)
+    finally:
+        admission.release(admitted_at)
 
+@app.post("/execute/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    """
+    Executes Python code like /execute, but streams newline-delimited JSON events:
+    {"type": "stdout"|"stderr", "data": ...} chunks as the program produces them,
+    then one {"type": "result", ...} event with the result minus stdout/stderr.
+    """
+    request = _resolve_test_code(request)
+    cache_key, cached = _lookup_cached(request)
+    admitted_at = None
+    if cached is None:
+        # Admit before the response starts so an overloaded executor can still answer 429
         try:
-            # Run Flake8
-            linter_process = await asyncio.create_subprocess_exec(
-                "flake8",
-                "--ignore=E501,W292,W391", # Ignore common style issues like line length, no newline at end of file
-                user_code_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            linter_stdout_bytes, linter_stderr_bytes = await linter_process.communicate()
-            linter_output = linter_stdout_bytes.decode("utf-8") + linter_stderr_bytes.decode("utf-8")
-        except FileNotFoundError:
-            linter_output = "Linter (flake8) not found. Please ensure it is installed in the execution environment."
+            admitted_at = await admission.acquire()
+        except ExecutorOverloaded as e:
+            raise _overloaded_response(e)
+
+    queue = asyncio.Queue()
+
+    def on_output(stream_name, text):
+        queue.put_nowait({"type": stream_name, "data": text})
+
+    async def produce():
+        try:
+            if cached is not None:
+                for stream_name in ("stdout", "stderr"):
+                    if cached[stream_name]:
+                        on_output(stream_name, cached[stream_name])
+                result = CodeExecutionResult(**cached)
+            else:
+                result = await _execute_and_cache(request, cache_key, on_output)
+            queue.put_nowait({"type": "result", **result.model_dump(exclude={"stdout", "stderr"})})
         except Exception as e:
-            linter_output = f"Error running linter: {e}"
+            queue.put_nowait({"type": "result", "returncode": 1, "error": f"Execution error: {e}", "linter_output": None})
         finally:
-            os.remove(user_code_path) # Clean up the temporary file
+            if admitted_at is not None:
+                admission.release(admitted_at)
+            queue.put_nowait(None)
 
-    # --- Execute User Code ---
-    # Re-create user_code_file for execution if it was removed by linter
-    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".py") as user_code_file:
-        user_code_file.write(request.user_code)
-        user_code_path = user_code_file.name
+    # Started here rather than in the generator so the slot is released even if
+    # the client disconnects before the body is sent
+    producer = asyncio.ensure_future(produce())
 
-    try:
-        user_process = await asyncio.create_subprocess_exec(
-            "python",
-            user_code_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+    async def events():
         try:
-            user_stdout_bytes, user_stderr_bytes = await asyncio.wait_for(user_process.communicate(), timeout=request.timeout)
-            user_stdout = user_stdout_bytes.decode("utf-8")
-            user_stderr = user_stderr_bytes.decode("utf-8")
-            user_returncode = user_process.returncode
-        except asyncio.TimeoutError:
-            user_process.kill()
-            user_stdout_bytes, user_stderr_bytes = await user_process.communicate()
-            user_stdout = user_stdout_bytes.decode("utf-8")
-            user_stderr = user_stderr_bytes.decode("utf-8")
-            user_returncode = -1
-            user_error_message = f"User code execution timed out after {request.timeout} seconds."
-        except Exception as e:
-            user_error_message = str(e)
-    finally:
-        os.remove(user_code_path)
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            producer.cancel() # The client went away: stop the run
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/execute/batch")
+async def execute_batch(request: BatchExecutionRequest):
+    """
+    Executes many jobs in one call, at most EXECUTOR_BATCH_CONCURRENCY at a time on
+    the shared fork server. Returns a BatchExecutionResult with results in job
+    order, or with "stream": true, newline-delimited {"index": i, ...result}
+    objects as each job finishes.
+    """
+    if len(request.jobs) > EXECUTOR_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {EXECUTOR_MAX_BATCH_SIZE} jobs.")
+    jobs = [_resolve_test_code(job) for job in request.jobs]
+
+    # Each running job holds an admission slot like an interactive run, so the two never
+    # oversubscribe the fork server together; the batch's own semaphore bounds its share
+    slots = asyncio.Semaphore(EXECUTOR_BATCH_CONCURRENCY)
+
+    async def run_one(index, job):
+        try:
+            cache_key, cached = _lookup_cached(job)
+            if cached is not None:
+                return index, CodeExecutionResult(**cached)
+            async with slots:
+                await admission.acquire_batch_slot()
+                try:
+                    return index, await _execute_and_cache(job, cache_key)
+                finally:
+                    admission.release_batch_slot()
+        except Exception as e: # One bad job must not fail the whole batch
+            return index, CodeExecutionResult(stdout="", stderr="", returncode=1, error=f"Execution error: {e}")
+
+    tasks = [asyncio.ensure_future(run_one(index, job)) for index, job in enumerate(jobs)]
+    batch = asyncio.gather(*tasks)
+
+    if not request.stream:
+        completed = await batch
+        return BatchExecutionResult(results=[result for _, result in completed])
+
+    async def results():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, result = await finished
+                yield json.dumps({"index": index, **result.model_dump()}) + "\n"
+        finally:
+            batch.cancel() # The client went away: stop the remaining runs
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _resolve_test_code(request: CodeExecutionRequest) -> CodeExecutionRequest:
+    """
+    Fills in test_code from the source cache when only test_hash was sent, and
+    remembers test sources that were sent. An unknown hash is a 409 so the client
+    can resend the request with the source.
+    """
+    if request.test_code is not None:
+        key = source_hash(request.test_code)
+        if request.test_hash is not None and request.test_hash != key:
+            raise HTTPException(status_code=400, detail="test_hash does not match test_code.")
+        test_sources.put(key, request.test_code)
+        return request.model_copy(update={"test_hash": key})
+    if request.test_hash is None:
+        return request
+    test_code = test_sources.get(request.test_hash)
+    if test_code is None:
+        raise HTTPException(status_code=409, detail=f"Unknown test_hash {request.test_hash}: resend the request with test_code.")
+    return request.model_copy(update={"test_code": test_code})
+
+def _lookup_cached(request: CodeExecutionRequest):
+    """Returns (cache_key, cached_result); cache_key is None when the request can't be cached."""
+    if not result_cache.enabled:
+        return None, None
+    if not (is_deterministic(request.user_code) and is_deterministic(request.test_code)):
+        result_cache.record_skip()
+        return None, None
+    # The limits are part of the key: a run stopped by an old limit must not be served once it changes
+    limits = json.dumps({**RUN_LIMITS, "stdout_bytes": EXECUTOR_MAX_STDOUT_BYTES, "stderr_bytes": EXECUTOR_MAX_STDERR_BYTES}, sort_keys=True)
+    cache_key = result_key(request.user_code, request.test_code, request.timeout, f"{RUNTIME_VERSION}|{request.language}|{limits}")
+    return cache_key, result_cache.get(cache_key)
+
+async def _execute_and_cache(request: CodeExecutionRequest, cache_key: Optional[str], on_output=None) -> CodeExecutionResult:
+    result, cacheable = await _execute(request, on_output)
+    if cache_key and cacheable:
+        await result_cache.put(cache_key, result.model_dump())
+    return result
+
+@app.get("/health")
+async def health():
+    """Liveness and load for the backend's health checks and load balancing."""
+    return {
+        "status": "ok",
+        "fork_server_running": fork_server.running, # A dead zygote is restarted by the next run
+        "active": admission.active,
+        "queue_depth": admission.waiting,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=executor_metrics.CONTENT_TYPE)
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    return admission.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {**result_cache.stats(), "test_sources": test_sources.stats()}
+
+def _record_run_metrics(run: RunOutcome):
+    for phase in ("spawn", "user", "test"):
+        seconds = getattr(run, f"{phase}_seconds")
+        if seconds is not None:
+            PHASE_SECONDS.observe(seconds, phase)
+    if run.timed_out:
+        outcome = "timeout"
+    elif run.limit_exceeded:
+        outcome = "limit"
+    elif run.error:
+        outcome = "error"
+    elif run.returncode == 0 and not run.stderr:
+        outcome = "success"
+    elif run.phase == "test" and "AssertionError" in run.stderr:
+        outcome = "assertion"
+    else:
+        outcome = "error" # The user code raised or exited non-zero
+    RUNS_TOTAL.inc(outcome)
+
+async def _execute(request: CodeExecutionRequest, on_output=None):
+    """
+    Lints and grades a request. Returns the result and whether it may be cached
+    (timeouts and executor failures depend on load, not on the code).
+    """
+    # --- Run Linter concurrently with execution ---
+    lint_task = None
+    if request.language == "python": # Only lint Python code
+        lint_task = asyncio.ensure_future(lint_code(request.user_code, request.timeout))
+
+    # --- Execute User Code and Test Code in one interpreter ---
+    try:
+        job = {"source": request.user_code, "test_source": request.test_code, "test_hash": request.test_hash, "limits": RUN_LIMITS}
+        run = await run_job(job, request.timeout, on_output)
+    except asyncio.CancelledError:
+        if lint_task:
+            lint_task.cancel()
+        raise
+    error_message = run.error
+    if run.limit_exceeded == "output":
+        error_message = "Output limit exceeded: the program printed too much and was stopped."
+    elif run.limit_exceeded == "cpu":
+        error_message = f"CPU time limit of {RUN_LIMITS['cpu_seconds']} seconds exceeded."
+    cacheable = not run.timed_out and not run.error
+    _record_run_metrics(run)
+    linter_output = await lint_task if lint_task else ""
 
     # If user code had an error, return immediately
-    if user_returncode != 0 or user_stderr or user_error_message:
+    if run.phase == "user":
+        if run.timed_out:
+            error_message = f"User code execution timed out after {request.timeout} seconds."
         return CodeExecutionResult(
-            stdout=user_stdout,
-            stderr=user_stderr,
-            returncode=user_returncode,
-            error=user_error_message or user_stderr,
+            stdout=run.stdout,
+            stderr=run.stderr,
+            returncode=run.returncode,
+            error=error_message or run.stderr,
             linter_output=linter_output # Include linter output
-        )
+        ), cacheable
 
-    # --- Execute Test Code (if provided) ---
-    if request.test_code:
-        test_stdout = ""
-        test_stderr = ""
-        test_returncode = 0
-        test_error_message = None
+    # --- Test Code result ---
+    if run.timed_out:
+        error_message = f"Test code execution timed out after {request.timeout} seconds."
 
-        # Prepare test code with user_printed_output injected
-        # We escape the user_stdout to ensure it's a valid string literal in Python
-        escaped_user_stdout = user_stdout.replace('\\', '\\\\').replace('"', '\"').replace('\n', '\\n')
-        injected_test_code = f"user_printed_output = {repr(user_stdout)}\n{request.test_code}"
+    # Check for assertion errors in test output
+    returncode = run.returncode
+    if "AssertionError" in run.stdout or "AssertionError" in run.stderr:
+        returncode = 1 # Indicate failure due to assertion
 
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".py") as test_code_file:
-            test_code_file.write(injected_test_code)
-            test_code_path = test_code_file.name
+    # If test code has an error, that takes precedence
+    if returncode != 0 or run.stderr or error_message:
+        return CodeExecutionResult(
+            stdout=run.stdout, # Show user output and any test output
+            stderr=run.stderr,
+            returncode=returncode,
+            error=error_message or run.stderr,
+            linter_output=linter_output # Include linter output
+        ), cacheable
 
-        try:
-            test_process = await asyncio.create_subprocess_exec(
-                "python",
-                test_code_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            try:
-                test_stdout_bytes, test_stderr_bytes = await asyncio.wait_for(test_process.communicate(), timeout=request.timeout)
-                test_stdout = test_stdout_bytes.decode("utf-8")
-                test_stderr = test_stderr_bytes.decode("utf-8")
-                test_returncode = test_process.returncode
-            except asyncio.TimeoutError:
-                test_process.kill()
-                test_stdout_bytes, test_stderr_bytes = await test_process.communicate()
-                test_stdout = test_stdout_bytes.decode("utf-8")
-                test_stderr = test_stderr_bytes.decode("utf-8")
-                test_returncode = -1
-                test_error_message = f"Test code execution timed out after {request.timeout} seconds."
-            except Exception as e:
-                test_error_message = str(e)
-        finally:
-            os.remove(test_code_path)
-
-
-
-
-        # Check for assertion errors in test output
-        if "AssertionError" in test_stdout or "AssertionError" in test_stderr:
-            test_returncode = 1 # Indicate failure due to assertion
-
-        # If test code has an error, that takes precedence
-        if test_returncode != 0 or test_stderr or test_error_message:
-            return CodeExecutionResult(
-                stdout=user_stdout + test_stdout, # Show user output and any test output
-                stderr=test_stderr,
-                returncode=test_returncode,
-                error=test_error_message or test_stderr,
-                linter_output=linter_output # Include linter output
-            )
-        else:
-            # Test code ran successfully
-            return CodeExecutionResult(
-                stdout=user_stdout + test_stdout,
-                stderr="",
-                returncode=0,
-                error=None,
-                linter_output=linter_output # Include linter output
-            )
-
-    # If no test code, just return user code execution result
+    # Test code ran successfully
     return CodeExecutionResult(
-        stdout=user_stdout,
-        stderr=user_stderr,
-        returncode=user_returncode,
-        error=user_error_message or user_stderr,
+        stdout=run.stdout,
+        stderr="",
+        returncode=0,
+        error=None,
         linter_output=linter_output # Include linter output
-    )
+    ), cacheable
@@ -0,0 +1,211 @@
+"""
+Content-addressed cache of execution results for the code executor. Results are
+keyed by a hash of everything that determines them (user code, test code, timeout
+and runtime version), kept in a bounded LRU with a TTL and optionally persisted
+to disk so they survive restarts.
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Modules whose use makes a program's output vary between runs, or that can reach such modules indirectly
+NONDETERMINISTIC_MODULES = {
+    "asyncio", "builtins", "ctypes", "datetime", "gc", "importlib", "inspect", "io",
+    "multiprocessing", "os", "pathlib", "platform", "random", "resource", "secrets",
+    "shutil", "signal", "socket", "subprocess", "sys", "tempfile", "threading", "time",
+    "tracemalloc", "urllib", "uuid",
+}
+# Builtins that read outside input, expose per-process values or run code the check can't see
+NONDETERMINISTIC_BUILTINS = {
+    "input", "open", "id", "hash", "__import__", "__builtins__", "eval", "exec",
+    "compile", "globals", "locals", "vars", "breakpoint",
+}
+# Attributes that lead back to module globals or builtins from any object
+INTROSPECTION_ATTRIBUTES = {"__builtins__", "__globals__", "__subclasses__", "__import__", "__loader__", "__spec__", "__dict__", "__code__"}
+ATTRIBUTE_LOOKUPS = {"getattr", "setattr", "delattr"}
+
+def _is_safe_attribute_lookup(node: ast.Call) -> bool:
+    """getattr(obj, "name") with a literal, harmless name; anything computed might reach builtins."""
+    if len(node.args) < 2 or not isinstance(node.args[1], ast.Constant) or not isinstance(node.args[1].value, str):
+        return False
+    name = node.args[1].value
+    return not name.startswith("__") and name not in NONDETERMINISTIC_BUILTINS and name not in NONDETERMINISTIC_MODULES
+
+def is_deterministic(source: Optional[str]) -> bool:
+    """
+    Best-effort static check that source always produces the same result: no
+    imports of time/randomness/OS modules, no stdin reads, no file access and no
+    dynamic imports, eval/exec or builtins lookups that could hide either.
+    """
+    if not source:
+        return True
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return True # The SyntaxError itself is the (deterministic) result
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in NONDETERMINISTIC_MODULES for alias in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Name) and node.id in NONDETERMINISTIC_BUILTINS:
+            return False
+        elif isinstance(node, ast.Attribute) and (node.attr == "stdin" or node.attr in INTROSPECTION_ATTRIBUTES):
+            return False
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ATTRIBUTE_LOOKUPS:
+            if not _is_safe_attribute_lookup(node):
+                return False
+    return True
+
+def result_key(user_code: str, test_code: Optional[str], timeout: int, runtime_version: str) -> str:
+    payload = json.dumps([user_code, test_code, timeout, runtime_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """Bounded LRU of result dicts with a TTL, optionally backed by a directory of JSON files."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+        self._entries = OrderedDict() # key -> (stored_at, result)
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._prune_directory()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None and self.directory:
+            entry = self._load(key)
+        if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._trim()
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            self._discard(key)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, result: dict):
+        entry = (time.time(), result)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._trim()
+        if self.directory:
+            await asyncio.to_thread(self._store, key, entry) # Keep file writes off the event loop
+
+    def record_skip(self):
+        self.skipped += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped_nondeterministic": self.skipped,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self.directory:
+                self._remove_file(key)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        if self.directory:
+            self._remove_file(key)
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                stored_at, result = json.load(f)
+            return stored_at, result
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, entry):
+        temp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._path(key)) # Readers never see a partial file
+        except OSError as e:
+            print(f"Error persisting execution result cache entry: {e}", file=sys.stderr)
+
+    def _prune_directory(self):
+        """Drops persisted entries that expired while the executor was down."""
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+class SourceCache:
+    """Bounded LRU of test sources by hash, so clients can send a hash instead of the source."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._sources = OrderedDict() # hash -> source
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        source = self._sources.get(key)
+        if source is None:
+            self.misses += 1
+            return None
+        self._sources.move_to_end(key)
+        self.hits += 1
+        return source
+
+    def put(self, key: str, source: str):
+        if self.max_entries <= 0:
+            return
+        self._sources[key] = source
+        self._sources.move_to_end(key)
+        while len(self._sources) > self.max_entries:
+            self._sources.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._sources), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
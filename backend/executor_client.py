@@ -0,0 +1,192 @@
+"""
+Client-side load balancing across several code executor instances. Requests are
+routed with power-of-two-choices on outstanding requests; nodes that fail
+health checks or connections are ejected for a while and probed until they
+recover. All requests share one keep-alive connection pool for the app's lifetime.
+"""
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+import httpx
+
+class NoExecutorAvailable(Exception):
+    pass
+
+class ExecutorNode:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.average_latency = None # Moving average in seconds
+        self.last_error = None
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "average_latency_seconds": self.average_latency,
+            "last_error": self.last_error,
+        }
+
+class ExecutorPool:
+    """
+    Routes each request to the less loaded of two random healthy nodes. A node is
+    ejected for eject_seconds after failure_threshold consecutive connection
+    failures or any failed health check; it is only routed to again once a
+    health check succeeds or the ejection expires.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        health_interval: float = 5.0,
+        eject_seconds: float = 30.0,
+        failure_threshold: int = 3,
+        limits: Optional[httpx.Limits] = None,
+        timeout: Optional[httpx.Timeout] = None,
+    ):
+        self.nodes = [ExecutorNode(url) for url in urls]
+        self.health_interval = health_interval
+        self.eject_seconds = eject_seconds
+        self.failure_threshold = failure_threshold
+        self.limits = limits or httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        self.timeout = timeout or httpx.Timeout(30.0, connect=2.0, pool=5.0)
+        self.pool_timeouts = 0
+        self._client = None
+        self._health_task = None
+        self._stopped = False
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared client; opened by start(), or on first use if start() wasn't called."""
+        if self._stopped:
+            raise NoExecutorAvailable("The executor pool has been stopped.") # Don't reopen a pool during shutdown
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def timeout_without_read_limit(self) -> httpx.Timeout:
+        """The pool's timeouts minus the read timeout, for streams and batches that may run long."""
+        return httpx.Timeout(self.timeout.connect, read=None, write=self.timeout.write, pool=self.timeout.pool)
+
+    def acquire(self, exclude=()) -> ExecutorNode:
+        """Picks a node and counts a request against it; pair every call with release()."""
+        if not self.nodes:
+            raise NoExecutorAvailable("No code executor URLs are configured.")
+        nodes = [node for node in self.nodes if node.url not in exclude] or self.nodes
+        candidates = [node for node in nodes if node.healthy] or nodes # All ejected: try anyway
+        if len(candidates) > 1:
+            first, second = random.sample(candidates, 2)
+            node = min(first, second, key=lambda node: (node.in_flight, node.average_latency or 0.0))
+        else:
+            node = candidates[0]
+        node.in_flight += 1
+        node.requests += 1
+        return node
+
+    def release(self, node: ExecutorNode, started: float, error: Optional[Exception] = None):
+        node.in_flight -= 1
+        if isinstance(error, httpx.PoolTimeout):
+            self.pool_timeouts += 1 # Our connection pool is exhausted; the node itself is fine
+            return
+        if isinstance(error, httpx.RequestError):
+            self._record_failure(node, error)
+            return
+        node.consecutive_failures = 0
+        latency = time.monotonic() - started
+        node.average_latency = latency if node.average_latency is None else 0.9 * node.average_latency + 0.1 * latency
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        """
+        POSTs to a routed node. A request that could not connect never reached an
+        executor, so it is retried once on another node.
+        """
+        tried = set()
+        while True:
+            node = self.acquire(exclude=tried)
+            tried.add(node.url)
+            started = time.monotonic()
+            try:
+                response = await self.client.post(f"{node.url}{path}", **kwargs)
+            except httpx.ConnectError as e:
+                self.release(node, started, e)
+                if len(tried) >= min(2, len(self.nodes)):
+                    raise
+                continue
+            except BaseException as e: # Including cancellation
+                self.release(node, started, e)
+                raise
+            self.release(node, started)
+            return response
+
+    def _record_failure(self, node: ExecutorNode, error: Exception, eject: bool = False):
+        node.failures += 1
+        node.consecutive_failures += 1
+        node.last_error = str(error) or type(error).__name__
+        if eject or node.consecutive_failures >= self.failure_threshold:
+            node.ejected_until = time.monotonic() + self.eject_seconds
+
+    async def _probe(self, client: httpx.AsyncClient, node: ExecutorNode):
+        try:
+            response = await client.get(f"{node.url}/health", timeout=2.0)
+            response.raise_for_status()
+        except Exception as e: # Anything else would end the health loop for good
+            self._record_failure(node, e, eject=True)
+        else:
+            node.consecutive_failures = 0
+            node.ejected_until = 0.0
+
+    async def check_health(self, client: httpx.AsyncClient):
+        await asyncio.gather(*(self._probe(client, node) for node in self.nodes))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health(self.client)
+            await asyncio.sleep(self.health_interval)
+
+    def start(self):
+        self._stopped = False
+        self.client # Open the shared connection pool
+        if self.nodes and self.health_interval > 0:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def stop(self):
+        self._stopped = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def connection_stats(self) -> dict:
+        """
+        Utilization of the shared connection pool, from counts kept here rather than
+        httpx internals. Each in-flight request holds one connection; the per-node
+        split is in the node stats.
+        """
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "in_flight_requests": sum(node.in_flight for node in self.nodes),
+            "pool_timeouts": self.pool_timeouts,
+        }
+
+    def stats(self) -> dict:
+        return {"nodes": [node.stats() for node in self.nodes], "connections": self.connection_stats()}
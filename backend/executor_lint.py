@@ -0,0 +1,52 @@
+"""
+In-process Python linting for the code executor. `lint_python` runs pyflakes and
+pycodestyle directly (no flake8 subprocess) and formats the findings the way
+flake8 prints them. It is run on the executor's lint worker pool.
+"""
+import ast
+
+import pycodestyle
+from pyflakes import checker as pyflakes_checker
+
+try:
+    from flake8.plugins.pyflakes import FLAKE8_PYFLAKES_CODES
+except ImportError:
+    FLAKE8_PYFLAKES_CODES = {}
+
+# Ignore common style issues like line length, no newline at end of file
+IGNORED_CODES = ["E501", "W292", "W391"]
+
+class _CollectingReport(pycodestyle.BaseReport):
+    """pycodestyle report that keeps (line, column, text) tuples instead of printing."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.findings = []
+
+    def error(self, line_number, offset, text, check):
+        code = super().error(line_number, offset, text, check)
+        if code:
+            self.findings.append((line_number, offset + 1, text))
+        return code
+
+_style_guide = pycodestyle.StyleGuide(ignore=IGNORED_CODES, reporter=_CollectingReport, quiet=True)
+
+def lint_python(source: str, filename: str = "<user_code>") -> str:
+    """Returns flake8-style output (`file:line:col: CODE message` lines) for source."""
+    try:
+        tree = ast.parse(source, filename=filename)
+    except SyntaxError as e:
+        return f"{filename}:{e.lineno or 1}:{e.offset or 1}: E999 SyntaxError: {e.msg}\n"
+
+    messages = []
+    for message in pyflakes_checker.Checker(tree, filename=filename).messages:
+        code = FLAKE8_PYFLAKES_CODES.get(type(message).__name__, "F")
+        text = message.message % message.message_args
+        messages.append((message.lineno, message.col + 1, f"{code} {text}"))
+
+    report = _CollectingReport(_style_guide.options)
+    pycodestyle.Checker(filename, lines=source.splitlines(True), options=_style_guide.options, report=report).check_all()
+    messages.extend(report.findings)
+
+    messages.sort(key=lambda message: (message[0], message[1]))
+    return "".join(f"{filename}:{line}:{column}: {text}\n" for line, column, text in messages)
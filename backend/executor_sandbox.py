@@ -0,0 +1,280 @@
+"""
+Child-side half of the code executor. This module is what actually runs submitted
+code: `zygote_main` is the fork-server loop and `grade_job` runs a user program and
+its tests in one interpreter. It deliberately imports nothing beyond the standard
+library so the zygote and the processes forked from it stay small.
+"""
+import io
+import os
+import sys
+import json
+import socket
+import struct
+import signal
+import time
+from collections import OrderedDict
+
+# Bumped whenever grading semantics change, so cached results from older versions are not reused
+HARNESS_VERSION = "2"
+
+# Standard library modules imported once by the zygote so forked children start warm
+ZYGOTE_PRELOAD_MODULES = [
+    "abc", "argparse", "collections", "copy", "dataclasses", "datetime", "decimal",
+    "enum", "fractions", "functools", "heapq", "io", "itertools", "json", "math",
+    "operator", "random", "re", "statistics", "string", "textwrap", "time",
+    "traceback", "typing", "unittest",
+]
+
+# Compiled test code kept by the zygote, keyed by the hash of the test source
+COMPILED_TEST_CACHE_SIZE = int(os.getenv("EXECUTOR_TEST_CACHE_SIZE", "256"))
+_compiled_tests = OrderedDict()
+
+def recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Fork server connection closed")
+        data += chunk
+    return data
+
+def _run_child(job, stdin_fd, stdout_fd, stderr_fd, status_fd, test_code=None):
+    """
+    Runs inside a freshly forked child: wires up the stdio pipes, grades the job
+    and exits with its return code. Never returns.
+    """
+    returncode = 1
+    try:
+        os.setsid() # Own process group so a timeout can kill anything the code spawns
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD}) # Blocked by the zygote around fork()
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        for fd in (stdin_fd, stdout_fd, stderr_fd):
+            os.close(fd)
+        returncode = grade_job(job, status_fd, test_code)
+    finally:
+        os._exit(returncode & 0xFF)
+
+class _TeeWriter(io.TextIOBase):
+    """Writes to the real stream while keeping an in-memory copy of everything written."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.captured = io.StringIO()
+
+    def write(self, text):
+        self.captured.write(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class _GradingScope(dict):
+    """
+    Globals for the test code. Besides `execution_scope` (the namespace the user code
+    ran in), it resolves `user_printed_output` to everything printed so far and
+    `user_return_value` to the latest `_user_return_value_capture`.
+    """
+
+    def __init__(self, execution_scope, stdout_tee):
+        super().__init__(__name__="__main__", __builtins__=execution_scope["__builtins__"])
+        self["execution_scope"] = execution_scope
+        self._stdout_tee = stdout_tee
+
+    def __missing__(self, key):
+        if key == "user_printed_output":
+            return self._stdout_tee.captured.getvalue()
+        if key == "user_return_value":
+            if "_user_return_value_capture" in self:
+                return self["_user_return_value_capture"]
+            if "_user_return_value_capture" in self["execution_scope"]:
+                return self["execution_scope"]["_user_return_value_capture"]
+        raise KeyError(key)
+
+def apply_limits(limits, status_fd):
+    """
+    Applies per-run resource limits (setrlimit) to this process and everything it
+    spawns: CPU seconds, address space bytes and maximum file size bytes. A limit of
+    0 or None leaves that resource alone.
+    """
+    import resource
+
+    for name, value in (("cpu_seconds", resource.RLIMIT_CPU), ("address_space_bytes", resource.RLIMIT_AS), ("file_size_bytes", resource.RLIMIT_FSIZE)):
+        limit = limits.get(name)
+        if limit:
+            # Leave headroom on the hard CPU limit so the SIGXCPU handler below gets to run
+            hard = limit + 1 if value == resource.RLIMIT_CPU else limit
+            resource.setrlimit(value, (limit, hard))
+
+    def on_cpu_limit(signum, frame):
+        os.write(2, f"CPU time limit of {limits['cpu_seconds']} seconds exceeded\n".encode("utf-8"))
+        _report_status(status_fd, {"limit": "cpu", "returncode": 1})
+        os._exit(1)
+
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+
+def _report_status(status_fd, event):
+    os.write(status_fd, (json.dumps(event) + "\n").encode("utf-8"))
+
+def grade_job(job, status_fd, test_code=None):
+    """
+    Grades a job in this interpreter: runs the user code as `__main__`, then, if it
+    succeeded without writing to stderr, runs the test code against its namespace.
+    Phase changes and the final return code are reported on the status pipe.
+    test_code is the test source already compiled, if the zygote had it cached.
+    """
+    import builtins
+
+    apply_limits(job.get("limits") or {}, status_fd)
+    sys.stdout.reconfigure(line_buffering=True) # Keep partial output if the run is killed
+    stdout_tee = _TeeWriter(sys.stdout)
+    stderr_tee = _TeeWriter(sys.stderr)
+    sys.stdout, sys.stderr = stdout_tee, stderr_tee
+    sys.argv = ["<user_code>"]
+
+    execution_scope = {"__name__": "__main__", "__builtins__": builtins}
+    clock = time.perf_counter # Held locally in case the user code replaces it
+    started = clock()
+    returncode = _execute_source(job["source"], "<user_code>", execution_scope)
+    timing = {"user_seconds": clock() - started}
+    if returncode == 0 and not stderr_tee.captured.getvalue() and job.get("test_source"):
+        _report_status(status_fd, {"phase": "test", **timing})
+        sys.argv = ["<test_code>"]
+        test_scope = _GradingScope(execution_scope, stdout_tee)
+        started = clock()
+        returncode = _execute_source(job["test_source"], "<test_code>", test_scope, test_code)
+        timing = {"test_seconds": clock() - started}
+
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        pass
+    _report_status(status_fd, {"returncode": returncode, **timing})
+    return returncode
+
+def _execute_source(source, filename, namespace, code=None):
+    """
+    Executes source (or its precompiled code object) in namespace, mirroring how
+    `python file.py` reports errors.
+    """
+    import linecache
+    import traceback
+
+    # Register the source so tracebacks can show the offending lines
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    try:
+        exec(code or compile(source, filename, "exec"), namespace)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Skip this harness frame so the traceback starts in the submitted code
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    return 0
+
+def _compiled_test(job):
+    """
+    Returns the job's test code compiled, from the zygote's LRU keyed by the test
+    source's hash, so forked children of busy lessons skip compiling it.
+    """
+    key, source = job.get("test_hash"), job.get("test_source")
+    if not key or not source or COMPILED_TEST_CACHE_SIZE <= 0:
+        return None
+    code = _compiled_tests.get(key)
+    if code is not None:
+        _compiled_tests.move_to_end(key)
+        return code
+    try:
+        code = compile(source, "<test_code>", "exec")
+    except (SyntaxError, ValueError):
+        return None # Compiled again in the child, which reports the error
+    _compiled_tests[key] = code
+    while len(_compiled_tests) > COMPILED_TEST_CACHE_SIZE:
+        _compiled_tests.popitem(last=False)
+    return code
+
+_child_status_fds = {} # pid -> the zygote's copy of that child's status pipe
+
+def _reap_children(signum, frame):
+    """
+    SIGCHLD handler in the zygote: reports each exited child's real exit status on
+    its status pipe, then closes the zygote's copy so the executor sees EOF. The
+    executor uses it when the child exited without reporting a return code itself
+    (e.g. the user code called os._exit()).
+    """
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        status_fd = _child_status_fds.pop(pid, None)
+        if status_fd is None:
+            continue
+        try:
+            _report_status(status_fd, {"exit_status": os.waitstatus_to_exitcode(status)})
+        except OSError:
+            pass # The executor stopped reading (the run was cancelled)
+        os.close(status_fd)
+
+def zygote_main(sock_fd):
+    """
+    Fork-server loop: preloads the standard library once, then forks one child per
+    request received on the socket and replies with the child's pid.
+    """
+    import importlib
+    import gc
+
+    for module_name in ZYGOTE_PRELOAD_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    signal.signal(signal.SIGCHLD, _reap_children)
+    sock = socket.socket(fileno=sock_fd)
+    gc.freeze() # Keep preloaded objects out of the collector so forks share their pages
+
+    while True:
+        try:
+            header, fds, _, _ = socket.recv_fds(sock, 4, 4)
+            if not header:
+                break
+            header += recv_exactly(sock, 4 - len(header))
+            (length,) = struct.unpack("!I", header)
+            job = json.loads(recv_exactly(sock, length).decode("utf-8"))
+        except (EOFError, ConnectionError):
+            break
+
+        stdin_fd, stdout_fd, stderr_fd, status_fd = fds
+        test_code = _compiled_test(job)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Blocked until the child's status pipe is registered, so a child that exits at once is still reported
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            _run_child(job, stdin_fd, stdout_fd, stderr_fd, status_fd, test_code)
+        _child_status_fds[pid] = status_fd
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+        for fd in (stdin_fd, stdout_fd, stderr_fd):
+            os.close(fd)
+        sock.sendall(struct.pack("!i", pid))
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--zygote"]:
+    zygote_main(int(sys.argv[2]))
+elif __name__ == "__main__" and sys.argv[1:2] == ["--run"]:
+    sys.exit(grade_job(json.loads(sys.stdin.read()), int(sys.argv[2])))
@@ -0,0 +1,140 @@
+"""
+Process-local cache of the lesson catalog. Lessons only change through the admin
+create/update endpoints, which invalidate the cache; between content releases
+every lesson read is served from memory as ready-to-send JSON, already
+compressed (gzip, and brotli when installed), along with the validators (ETag,
+Last-Modified) for conditional requests. Compression happens once per edit
+instead of once per request. Each worker
+process has its own cache, so the TTL bounds how long another worker can serve
+a lesson after it was edited elsewhere.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+try:
+    import brotli
+except ImportError: # Optional: without it only gzip variants are kept
+    brotli = None
+
+# Compression runs once per edit, so use the slowest, smallest settings
+GZIP_LEVEL = int(os.getenv("LESSON_GZIP_LEVEL", "9"))
+BROTLI_QUALITY = int(os.getenv("LESSON_BROTLI_QUALITY", "11"))
+MIN_COMPRESS_BYTES = 512 # Smaller bodies aren't worth a Content-Encoding
+
+class CachedResponse:
+    """A serialized JSON body, its compressed variants and its validators."""
+
+    def __init__(self, body: bytes, last_modified: Optional[datetime] = None):
+        self.body = body
+        # Strong validator: a hash of the exact bytes, so it is the same on every worker
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if last_modified is not None and last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc) # SQLite returns naive UTC
+        self.last_modified = last_modified
+        self.encoded: Dict[str, bytes] = {} # Content-Encoding -> body, only where it is smaller
+        if len(body) >= MIN_COMPRESS_BYTES:
+            variants = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)} # mtime=0: same bytes on every worker
+            if brotli is not None:
+                variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+            self.encoded = {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """Each encoding is a different representation, so it needs its own strong ETag."""
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    @property
+    def etags(self) -> set:
+        return {self.etag_for(encoding) for encoding in (None, *self.encoded)}
+
+    @property
+    def last_modified_header(self) -> Optional[str]:
+        if self.last_modified is None:
+            return None
+        return format_datetime(self.last_modified.astimezone(timezone.utc), usegmt=True)
+
+class LessonCache:
+    """Bounded LRU of CachedResponses with a TTL, cleared by invalidate()."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (stored_at, CachedResponse)
+        self._generation = 0 # Bumped on invalidation, so loads that raced a write aren't stored
+        self._loading: Dict[Hashable, asyncio.Future] = {} # Concurrent misses share one load
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[Optional[CachedResponse]]]) -> Optional[CachedResponse]:
+        """Returns the cached response for key, or awaits load() and caches what it returns (unless None)."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        while key in self._loading:
+            future = self._loading[key]
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+            # The request doing the load was cancelled; load it here instead
+        generation = self._generation
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            cached = await load()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Marks it retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(cached)
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._loading[key]
+        if cached is not None and generation == self._generation:
+            self.put(key, cached)
+        return cached
+
+    def put(self, key: Hashable, cached: CachedResponse):
+        """Stores a response rendered elsewhere, e.g. by the endpoint that just wrote the lesson."""
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic(), cached)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drops everything; the list of all lessons depends on every lesson anyway."""
+        self._entries.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,23 +1,78 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware # Added this import
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, selectinload
 
 import models, schemas, auth
-from database import get_db, engine, SessionLocal
-from typing import List, Optional # Import Optional
+from database import get_db, async_engine, AsyncSessionLocal
+from typing import List, Literal, Optional # Import Optional
 import httpx # Import httpx for making HTTP requests
 import os # Import os to read environment variables
 from dotenv import load_dotenv # Import load_dotenv
-from black import format_str, FileMode, NothingChanged # Import black for code formatting
-import subprocess # Add subprocess import
-import tempfile # Add tempfile import
+from black import format_str, FileMode # Import black for code formatting
 import asyncio # Add asyncio import
-
+import json
+import time
+import hashlib
+from email.utils import parsedate_to_datetime
+from contextlib import asynccontextmanager
+from executor_client import ExecutorPool
+from execution_jobs import ExecutionJobStore, JobQueueFull
+import db_instrumentation
+from lesson_cache import CachedResponse, LessonCache
+from pagination import InvalidCursor, keyset_page, next_cursor
+from completions import ProgressWriter, upsert_completion
+
+# Code executor instances: a comma-separated CODE_EXECUTOR_URLS, or a single CODE_EXECUTOR_URL
 CODE_EXECUTOR_URL = os.getenv("CODE_EXECUTOR_URL") # Define CODE_EXECUTOR_URL here
+CODE_EXECUTOR_URLS = [url.strip() for url in os.getenv("CODE_EXECUTOR_URLS", CODE_EXECUTOR_URL or "").split(",") if url.strip()]
+# The most jobs the executors accept in one /execute/batch call (their EXECUTOR_MAX_BATCH_SIZE)
+CODE_EXECUTOR_MAX_BATCH_SIZE = int(os.getenv("CODE_EXECUTOR_MAX_BATCH_SIZE", "1000"))
+# Jobs are held in this process's memory: with more than one worker, a job id only
+# resolves on the worker that accepted it (see execution_jobs)
+execution_jobs = ExecutionJobStore(
+    max_running=int(os.getenv("EXECUTION_JOB_WORKERS", "32")), # Runs in flight to the executors at once
+    max_pending=int(os.getenv("EXECUTION_JOB_MAX_PENDING", "1000")),
+    result_ttl=float(os.getenv("EXECUTION_JOB_RESULT_TTL", "300")), # seconds
+)
+executor_pool = ExecutorPool(
+    CODE_EXECUTOR_URLS,
+    health_interval=float(os.getenv("CODE_EXECUTOR_HEALTH_INTERVAL", "5")), # seconds, 0 disables health checks
+    eject_seconds=float(os.getenv("CODE_EXECUTOR_EJECT_SECONDS", "30")),
+    # One keep-alive connection pool shared by every request to the executors
+    limits=httpx.Limits(
+        max_connections=int(os.getenv("CODE_EXECUTOR_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("CODE_EXECUTOR_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("CODE_EXECUTOR_KEEPALIVE_EXPIRY", "30")),
+    ),
+    # The read timeout covers the run itself (10s), queueing and linting on the executor
+    timeout=httpx.Timeout(
+        float(os.getenv("CODE_EXECUTOR_READ_TIMEOUT", "30")),
+        connect=float(os.getenv("CODE_EXECUTOR_CONNECT_TIMEOUT", "2")),
+        pool=float(os.getenv("CODE_EXECUTOR_POOL_TIMEOUT", "5")), # Waiting for a free connection
+    ),
+)
+
+# Serialized lesson responses; invalidated by create_lesson/update_lesson
+lesson_cache = LessonCache(
+    max_entries=int(os.getenv("LESSON_CACHE_MAX_ENTRIES", "1024")), # 0 disables the cache
+    ttl_seconds=float(os.getenv("LESSON_CACHE_TTL", "300")), # Bounds staleness across worker processes
+)
+# Lets browsers and the nginx front reuse lesson responses, revalidating with ETag after max-age
+LESSON_CACHE_CONTROL = os.getenv("LESSON_CACHE_CONTROL", "public, max-age=60")
+
+# Progress saved after each code run is written behind the response, coalesced per lesson
+progress_writer = ProgressWriter(
+    lambda: _background_session(),
+    flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", "1")), # seconds a run's progress may wait to be saved
+    max_pending=int(os.getenv("PROGRESS_MAX_PENDING", "5000")), # (user, lesson) pairs waiting before record() flushes inline
+)
 
 app = FastAPI()
 
@@ -31,12 +86,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Lets the admin UI read the pagination cursor
 )
 
+# Per-request query counts, N+1 and slow statement logging for a sample of requests
+db_instrumentation.install(async_engine.sync_engine)
+app.add_middleware(db_instrumentation.InstrumentRequests)
+
 # Create database tables on startup
 @app.on_event("startup")
-def on_startup():
-    models.Base.metadata.create_all(bind=engine)
+async def on_startup():
+    async with async_engine.begin() as connection:
+        await connection.run_sync(models.Base.metadata.create_all) # Columns added to existing tables: see migrate_schema.py
 
     # Create admin user if not exists
     admin_email = os.getenv("ADMIN_EMAIL")
@@ -45,11 +106,11 @@ def on_startup():
     print(f"Debug: ADMIN_PASSWORD = {admin_password}")
 
     if admin_email and admin_password:
-        db = SessionLocal()
+        db = AsyncSessionLocal()
         try:
-            existing_admin = db.query(models.User).filter(models.User.email == admin_email).first()
+            existing_admin = await db.scalar(select(models.User).where(models.User.email == admin_email))
             if not existing_admin:
-                hashed_password = auth.get_password_hash(admin_password)
+                hashed_password = await auth.password_hasher.hash(admin_password)
                 admin_user = models.User(
                     email=admin_email,
                     hashed_password=hashed_password,
@@ -57,50 +118,167 @@ def on_startup():
                     name="Admin"
                 )
                 db.add(admin_user)
-                db.commit()
-                db.refresh(admin_user)
+                await db.commit()
                 print(f"Admin user {admin_email} created successfully!")
             else:
                 print(f"Admin user {admin_email} already exists.")
         except Exception as e:
             print(f"Error creating admin user: {e}")
         finally:
-            db.close()
+            await db.close()
+
+@app.on_event("startup")
+async def start_executor_pool():
+    executor_pool.start()
+
+@app.on_event("shutdown")
+async def finish_execution_jobs():
+    await execution_jobs.shutdown()
+
+@app.on_event("shutdown")
+async def stop_executor_pool():
+    await executor_pool.stop() # After finish_execution_jobs: running jobs still need the shared client
+
+@app.on_event("startup")
+async def start_progress_writer():
+    progress_writer.start()
+
+@app.on_event("shutdown")
+async def flush_progress_writer():
+    await progress_writer.stop() # After finish_execution_jobs, so their attempts are written too
+
+@app.on_event("shutdown")
+async def stop_password_hasher():
+    auth.password_hasher.shutdown()
 
 @app.get("/")
 async def read_root():
     return {"message": "Hello from FastAPI backend!"}
 
+def _lesson_json(lesson: models.Lesson) -> dict:
+    return {column.name: getattr(lesson, column.name) for column in models.Lesson.__table__.columns}
+
+def _json_body(content) -> bytes:
+    return JSONResponse(content=jsonable_encoder(content)).body # Same encoding FastAPI uses for returned values
+
+async def _render(content, last_modified=None) -> CachedResponse:
+    # Compressing at the highest levels takes a while on the full catalog; keep it off the event loop
+    return await asyncio.to_thread(CachedResponse, _json_body(content), last_modified)
+
+def _accepted_encoding(request: Request, cached: CachedResponse) -> Optional[str]:
+    """The best precompressed variant the client accepts, or None for the plain body."""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in cached.encoded and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+def _not_modified(request: Request, cached: CachedResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None: # Takes precedence over If-Modified-Since
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag in cached.etags for tag in tags)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and cached.last_modified is not None:
+        try:
+            return cached.last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _lesson_response(request: Request, cached: CachedResponse) -> Response:
+    """Sends a cached lesson body as stored (compressed if the client accepts it), or 304 if the client already has it."""
+    encoding = _accepted_encoding(request, cached)
+    headers = {"ETag": cached.etag_for(encoding), "Cache-Control": LESSON_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if cached.last_modified is not None:
+        headers["Last-Modified"] = cached.last_modified_header
+    if _not_modified(request, cached):
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(content=cached.body, media_type="application/json", headers=headers)
+    headers["Content-Encoding"] = encoding
+    return Response(content=cached.encoded[encoding], media_type="application/json", headers=headers)
+
+async def _lesson_exists(db: AsyncSession, lesson_id: int) -> bool:
+    if lesson_cache.get(lesson_id) is not None:
+        return True # Cached lessons exist (until an edit, and lessons are never deleted)
+    return await db.scalar(select(models.Lesson.id).where(models.Lesson.id == lesson_id)) is not None
+
+MAX_PAGE_SIZE = 500
+
+def _keyset_page(query, sort_column, id_column, cursor: Optional[str], order_by: str, descending: bool, limit: int):
+    try:
+        return keyset_page(query, sort_column, id_column, cursor, order_by, descending, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/lessons/")
-async def get_lessons(db: Session = Depends(get_db)):
-    lessons = db.query(models.Lesson).all()
-    return lessons
+async def get_lessons(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), # Omitted: every matching lesson
+    cursor: Optional[str] = None, # From the previous page's X-Next-Cursor header
+    order_by: Literal["id", "title"] = "id",
+    descending: bool = False,
+    title_prefix: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    if limit is None and cursor is None and title_prefix is None and order_by == "id" and not descending:
+        async def load():
+            lessons = (await db.scalars(select(models.Lesson).order_by(models.Lesson.id))).all()
+            last_modified = max((lesson.updated_at for lesson in lessons if lesson.updated_at is not None), default=None)
+            return await _render([_lesson_json(lesson) for lesson in lessons], last_modified)
+
+        return _lesson_response(request, await lesson_cache.get_or_load("all", load))
+
+    if cursor is not None and limit is None:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    query = select(models.Lesson)
+    if title_prefix:
+        query = query.where(models.Lesson.title.startswith(title_prefix, autoescape=True))
+    sort_column = getattr(models.Lesson, order_by)
+    headers = {}
+    if limit is None:
+        lessons = (await db.scalars(query.order_by(sort_column.desc() if descending else sort_column, models.Lesson.id))).all()
+    else:
+        lessons = list((await db.scalars(_keyset_page(query, sort_column, models.Lesson.id, cursor, order_by, descending, limit))).all())
+        cursor = next_cursor(lessons, order_by, descending, limit)
+        if cursor:
+            headers["X-Next-Cursor"] = cursor
+    return Response(content=_json_body([_lesson_json(lesson) for lesson in lessons]), media_type="application/json", headers=headers)
 
 @app.get("/lessons/{lesson_id}")
-async def get_lesson(lesson_id: int, db: Session = Depends(get_db)):
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if lesson is None:
+async def get_lesson(lesson_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        lesson = await db.get(models.Lesson, lesson_id)
+        return await _render(_lesson_json(lesson), lesson.updated_at) if lesson is not None else None
+
+    cached = await lesson_cache.get_or_load(lesson_id, load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    return lesson
+    return _lesson_response(request, cached)
 
 @app.post("/signup/", response_model=schemas.User)
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     if len(user.password.encode('utf-8')) > 72:
         raise HTTPException(status_code=400, detail="Password cannot be longer than 72 characters")
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.password_hasher.hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password, is_admin=False, name=user.name) # Add name=user.name
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user, ["lesson_completions"]) # Loaded here; lazy loads can't run during serialization
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == form_data.username))
+    if not user or not await auth.password_hasher.verify(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -112,21 +290,32 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users/me/", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+async def _current_user_with_saved_progress(current_user: auth.Principal = Depends(auth.get_current_user)) -> auth.Principal:
+    """get_current_user for endpoints that read or write the user's lesson progress."""
+    await progress_writer.flush_user(current_user.id)
     return current_user
 
+@app.get("/users/me/", response_model=schemas.User)
+async def read_users_me(db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(_current_user_with_saved_progress)):
+    user = await db.scalar(select(models.User).options(selectinload(models.User.lesson_completions)).where(models.User.id == current_user.id))
+    if user is None: # Deleted by another worker while its principal was still cached here
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
 @app.post("/lessons/", response_model=schemas.Lesson)
-async def create_lesson(lesson: schemas.LessonCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin_user)): # Protected by admin user
+async def create_lesson(lesson: schemas.LessonCreate, db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_admin_user)): # Protected by admin user
     db_lesson = models.Lesson(title=lesson.title, content=lesson.content, code_example=lesson.code_example, prefill_code=lesson.prefill_code, test_code=lesson.test_code)
     db.add(db_lesson)
-    db.commit()
-    db.refresh(db_lesson)
+    await db.commit()
+    rendered = await _render(_lesson_json(db_lesson), db_lesson.updated_at) # Pay for compression here, not on reads
+    lesson_cache.invalidate()
+    lesson_cache.put(db_lesson.id, rendered)
+    await db.refresh(db_lesson, ["completions"])
     return db_lesson
 
 @app.put("/lessons/{lesson_id}", response_model=schemas.Lesson)
-async def update_lesson(lesson_id: int, lesson: schemas.LessonCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    db_lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+async def update_lesson(lesson_id: int, lesson: schemas.LessonCreate, db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_admin_user)):
+    db_lesson = await db.scalar(select(models.Lesson).options(selectinload(models.Lesson.completions)).where(models.Lesson.id == lesson_id))
     if db_lesson is None:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
@@ -135,168 +324,130 @@ async def update_lesson(lesson_id: int, lesson: schemas.LessonCreate, db: Sessio
     db_lesson.code_example = lesson.code_example
     db_lesson.prefill_code = lesson.prefill_code
     db_lesson.test_code = lesson.test_code
-    db.commit()
-    db.refresh(db_lesson)
+    await db.commit()
+    rendered = await _render(_lesson_json(db_lesson), db_lesson.updated_at)
+    lesson_cache.invalidate()
+    lesson_cache.put(lesson_id, rendered)
     return db_lesson
 
 @app.put("/lessons/{lesson_id}/completion", response_model=schemas.UserLessonCompletion)
 async def update_lesson_completion(
     lesson_id: int,
     completion_data: schemas.UserLessonCompletionCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    # Check if lesson exists
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
+    if not await _lesson_exists(db, lesson_id):
         raise HTTPException(status_code=404, detail="Lesson not found")
 
-    # Find existing completion record
-    completion = db.query(models.UserLessonCompletion).filter(
-        models.UserLessonCompletion.user_id == current_user.id,
-        models.UserLessonCompletion.lesson_id == lesson_id
-    ).first()
-
-    if completion:
-        # Update existing completion record
-        completion.status = completion_data.status
-        completion.last_attempted_code = completion_data.last_attempted_code
-        completion.notes = completion_data.notes  # Update notes
-        completion.bookmarked = completion_data.bookmarked  # Update bookmarked
-        if completion_data.status == "completed" and not completion.completed_at:
-            completion.completed_at = func.now()
-        elif completion_data.status != "completed":
-            completion.completed_at = None # Clear completed_at if status is not completed
-    else:
-        # Create new completion record
-        completion = models.UserLessonCompletion(
-            user_id=current_user.id,
-            lesson_id=lesson_id,
-            status=completion_data.status,
-            last_attempted_code=completion_data.last_attempted_code,
-            notes=completion_data.notes,  # Set notes
-            bookmarked=completion_data.bookmarked,  # Set bookmarked
-        )
-        if completion_data.status == "completed":
-            completion.completed_at = func.now()
-        db.add(completion)
-
-    db.commit()
-    db.refresh(completion)
-
+    completed = completion_data.status == "completed"
+    values = {
+        "status": completion_data.status,
+        "last_attempted_code": completion_data.last_attempted_code,
+        "notes": completion_data.notes,
+        "bookmarked": completion_data.bookmarked,
+        "completed_at": func.now() if completed else None,
+        "last_attempted_at": datetime.now(timezone.utc), # Orders this write against queued attempts
+    }
+    # Keep the original completion time when an already completed lesson is saved again
+    update = {**values, "completed_at": func.coalesce(models.UserLessonCompletion.completed_at, func.now()) if completed else None}
+    completion = await upsert_completion(db, current_user.id, lesson_id, values, update)
+    await db.commit()
     return completion
 
 @app.post("/lessons/{lesson_id}/start", response_model=schemas.UserLessonCompletion)
 async def start_lesson(
     lesson_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    # Check if lesson exists
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
-    if not lesson:
+    if not await _lesson_exists(db, lesson_id):
         raise HTTPException(status_code=404, detail="Lesson not found")
 
-    # Find existing completion record
-    completion = db.query(models.UserLessonCompletion).filter(
-        models.UserLessonCompletion.user_id == current_user.id,
-        models.UserLessonCompletion.lesson_id == lesson_id
-    ).first()
-
-    if not completion:
-        # Create new completion record with status 'started'
-        completion = models.UserLessonCompletion(
-            user_id=current_user.id,
-            lesson_id=lesson_id,
-            status="started"
-        )
-        db.add(completion)
-        db.commit()
-        db.refresh(completion)
-    
+    # Creates the record with status 'started'; an existing record is left as it is
+    completion = await upsert_completion(db, current_user.id, lesson_id, {"status": "started"}, update={})
+    if completion is None:
+        completion = await db.get(models.UserLessonCompletion, (current_user.id, lesson_id))
+    else:
+        await db.commit()
     return completion
 
 @app.delete("/lessons/{lesson_id}/complete")
 async def uncomplete_lesson(
     lesson_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
     # Check if lesson exists
-    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+    lesson = await db.get(models.Lesson, lesson_id)
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
 
     # Check if already completed
-    completion = db.query(models.UserLessonCompletion).filter(
-        models.UserLessonCompletion.user_id == current_user.id,
-        models.UserLessonCompletion.lesson_id == lesson_id
-    ).first()
+    completion = await db.get(models.UserLessonCompletion, (current_user.id, lesson_id))
 
     if not completion:
         raise HTTPException(status_code=400, detail="Lesson not marked as completed by this user.")
 
-    db.delete(completion)
-    db.commit()
+    await db.delete(completion)
+    await db.commit()
     return {"message": "Lesson marked as incomplete!"}
 
 @app.get("/users/me/lessons/{lesson_id}/code", response_model=Optional[schemas.UserLessonCompletion])
 async def get_user_lesson_completion(
     lesson_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    completion = db.query(models.UserLessonCompletion).filter(
-        models.UserLessonCompletion.user_id == current_user.id,
-        models.UserLessonCompletion.lesson_id == lesson_id
-    ).first()
+    completion = await db.get(models.UserLessonCompletion, (current_user.id, lesson_id))
     return completion
 
 @app.get("/users/me/lessons/completed", response_model=List[schemas.Lesson])
 async def get_completed_lessons_for_current_user(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    completed_lessons = db.query(models.Lesson).join(models.UserLessonCompletion).filter(
+    completed_lessons = (await db.scalars(select(models.Lesson).join(models.UserLessonCompletion).options(selectinload(models.Lesson.completions)).where(
         models.UserLessonCompletion.user_id == current_user.id,
         models.UserLessonCompletion.status == "success"
-    ).all()
+    ))).all()
     return completed_lessons
 
 @app.get("/users/me/lesson-completions", response_model=List[schemas.UserLessonCompletion])
 async def get_all_user_lesson_completions(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    all_completions = db.query(models.UserLessonCompletion).filter(
+    all_completions = (await db.scalars(select(models.UserLessonCompletion).where(
         models.UserLessonCompletion.user_id == current_user.id
-    ).all()
+    ))).all()
     return all_completions
 
 @app.delete("/users/me/lessons/completed")
 async def reset_all_lesson_progress(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    db.query(models.UserLessonCompletion).filter(
+    await db.execute(delete(models.UserLessonCompletion).where(
         models.UserLessonCompletion.user_id == current_user.id
-    ).delete()
-    db.commit()
+    ))
+    await db.commit()
     return {"message": "All lesson progress reset!"}
 
 @app.delete("/users/me")
 async def delete_user_account(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
     # Delete associated lesson completions first
-    db.query(models.UserLessonCompletion).filter(
+    await db.execute(delete(models.UserLessonCompletion).where(
         models.UserLessonCompletion.user_id == current_user.id
-    ).delete()
-    
-    # Then delete the user
-    db.delete(current_user)
-    db.commit()
+    ))
+
+    # Then delete the user (current_user is not an ORM object, so delete by id)
+    await db.execute(delete(models.User).where(models.User.id == current_user.id))
+    await db.commit()
+    auth.principal_cache.invalidate_user(current_user.id)
     return {"message": "User account deleted successfully!"}
 
     db_user = session.query(models.User).filter(models.User.email == "deleter@example.com").first()
@@ -304,19 +455,52 @@ async def delete_user_account(
 
 @app.get("/users/", response_model=List[schemas.User])
 async def get_all_users(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_admin_user) # Admin protected
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None, # From the previous page's X-Next-Cursor header
+    order_by: Literal["id", "email"] = "id",
+    descending: bool = False,
+    search: Optional[str] = None,
+    email_prefix: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    is_admin: Optional[bool] = None,
+    include_completions: bool = False, # Otherwise lesson_completions is returned empty
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin_user) # Admin protected
 ):
-    users = db.query(models.User).all()
+    """
+    Lists users one page at a time: at most `limit` users (100 unless given), with
+    the cursor for the next page in the X-Next-Cursor header. `search` matches a
+    case-insensitive substring of the email or name; `email_prefix` is an indexed
+    prefix match on the email.
+    """
+    query = select(models.User).options(selectinload(models.User.lesson_completions) if include_completions else noload(models.User.lesson_completions))
+    if search:
+        term = search.lower()
+        query = query.where(or_(
+            func.lower(models.User.email).contains(term, autoescape=True),
+            func.lower(models.User.name).contains(term, autoescape=True),
+        ))
+    if email_prefix:
+        query = query.where(models.User.email.startswith(email_prefix, autoescape=True))
+    if is_active is not None:
+        query = query.where(models.User.is_active == is_active)
+    if is_admin is not None:
+        query = query.where(models.User.is_admin == is_admin)
+    query = _keyset_page(query, getattr(models.User, order_by), models.User.id, cursor, order_by, descending, limit)
+    users = list((await db.scalars(query)).all())
+    cursor = next_cursor(users, order_by, descending, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
     return users
 
 @app.get("/users/{user_id}", response_model=schemas.User)
 async def get_user_by_id(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_admin_user) # Admin protected
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin_user) # Admin protected
 ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.scalar(select(models.User).options(selectinload(models.User.lesson_completions)).where(models.User.id == user_id))
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -325,10 +509,10 @@ async def get_user_by_id(
 async def update_user(
     user_id: int,
     user_update: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_admin_user) # Admin protected
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin_user) # Admin protected
 ):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.scalar(select(models.User).options(selectinload(models.User.lesson_completions)).where(models.User.id == user_id))
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -337,155 +521,389 @@ async def update_user(
         setattr(db_user, key, value)
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    auth.principal_cache.invalidate_user(user_id) # Email and admin changes apply to existing sessions
     return db_user
 
 @app.delete("/users/{user_id}")
 async def delete_user_by_id(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_admin_user) # Admin protected
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin_user) # Admin protected
 ):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
+    await progress_writer.flush_user(user_id) # Otherwise a queued attempt could recreate a completion afterwards
     # Delete associated lesson completions first
-    db.query(models.UserLessonCompletion).filter(
+    await db.execute(delete(models.UserLessonCompletion).where(
         models.UserLessonCompletion.user_id == user_id
-    ).delete()
-    
+    ))
+
     # Then delete the user
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    auth.principal_cache.invalidate_user(user_id)
     return {"message": "User deleted successfully!"}
 
 @app.get("/users/me/lessons/bookmarked", response_model=List[schemas.Lesson])
 async def get_bookmarked_lessons_for_current_user(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.Principal = Depends(_current_user_with_saved_progress)
 ):
-    bookmarked_lessons = db.query(models.Lesson).join(models.UserLessonCompletion).filter(
+    bookmarked_lessons = (await db.scalars(select(models.Lesson).join(models.UserLessonCompletion).options(selectinload(models.Lesson.completions)).where(
         models.UserLessonCompletion.user_id == current_user.id,
         models.UserLessonCompletion.bookmarked == True
-    ).all()
+    ))).all()
     return bookmarked_lessons
 
 @app.post("/format-code/", response_model=str)
-async def format_code(request: Request, current_user: models.User = Depends(auth.get_current_user)):
+async def format_code(request: Request, current_user: auth.Principal = Depends(auth.get_current_user)):
     code = await request.body()
     code_str = code.decode("utf-8")
-    
-    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".py") as temp_file:
-        temp_file.write(code_str)
-        temp_file_path = temp_file.name
 
     try:
-        # Run black as a subprocess on the temporary file
-        process = await asyncio.create_subprocess_exec(
-            "black",
-            temp_file_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode == 0: # Black ran successfully (no changes or changes made)
-            # Read the formatted code from the temporary file
-            with open(temp_file_path, "r") as f:
-                formatted_code = f.read()
-            return formatted_code
-        elif process.returncode == 1: # Black made changes
-            with open(temp_file_path, "r") as f:
-                formatted_code = f.read()
-            return formatted_code
-        else: # Black encountered an error
-            raise HTTPException(status_code=400, detail=f"Black formatting error: {stderr.decode('utf-8')}")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="Black formatter not found. Please ensure it is installed.")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error formatting code: {e}")
-    finally:
-        os.remove(temp_file_path) # Clean up the temporary file
+        # Format in memory with black's API; it is CPU-bound, so keep it off the event loop
+        return await asyncio.to_thread(format_str, code_str, mode=FileMode())
+    except Exception as e: # black raises InvalidInput (and others) for code it can't parse
+        raise HTTPException(status_code=400, detail=f"Black formatting error: {e}")
+
+def _grade_status(returncode: int, has_stderr: bool, error: Optional[str], tests_passed: bool, assertion_failed: bool) -> str:
+    """Maps an executor result onto the lesson completion status stored for the attempt."""
+    status_str = "error" # Default to error
+    if returncode == 0 and not has_stderr and not error:
+        if tests_passed:
+            status_str = "success"
+        else:
+            status_str = "attempted" # Code ran, but tests didn't explicitly pass
+    elif returncode == 1 and assertion_failed:
+        status_str = "attempted" # Code ran, but tests failed due to assertion
+    return status_str
+
+def _grade_executor_result(executor_result: dict) -> str:
+    combined_output = executor_result["stdout"] + executor_result["stderr"]
+    return _grade_status(
+        executor_result["returncode"],
+        bool(executor_result["stderr"]),
+        executor_result["error"],
+        tests_passed="Tests passed" in executor_result["stdout"],
+        assertion_failed="AssertionError" in combined_output,
+    )
 
-@app.post("/execute-code/", response_model=schemas.CodeExecutionResult)
-async def execute_code(request: schemas.CodeExecutionRequest, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+async def _record_attempt(user_id: int, lesson_id: int, code: str, status_str: str):
+    # Queue the last attempted code and status; progress_writer upserts the UserLessonCompletion
+    await progress_writer.record(user_id, lesson_id, code, status_str)
+
+def _background_session():
+    """A session for work done outside a request's get_db session (honours get_db overrides)."""
+    return asynccontextmanager(app.dependency_overrides.get(get_db, get_db))()
+
+async def _check_execution_request(request: schemas.CodeExecutionRequest):
     if request.language != "python":
         raise HTTPException(status_code=400, detail="Only Python execution is supported for now.")
 
-    if not CODE_EXECUTOR_URL:
+    if not executor_pool.nodes:
         raise HTTPException(status_code=500, detail="CODE_EXECUTOR_URL environment variable is not set.")
 
-    # Combine user code and test code for execution in the executor service
-    code_to_execute = request.code
-    if request.test_code:
-        # A simple way to combine: run user code, then test code
-        # In a real scenario, you might want more sophisticated test integration
-        code_to_execute += f"\n\n# --- Test Code ---\n{request.test_code}"
+    # The run's progress is saved against the lesson. A short-lived session, so none is held during the run
+    async with _background_session() as db:
+        if not await _lesson_exists(db, request.lesson_id):
+            raise HTTPException(status_code=404, detail="Lesson not found")
+
+def _executor_job(request: schemas.CodeExecutionRequest, send_test_code: bool = False) -> dict:
+    """
+    Builds the executor request for a run. Tests are referenced by the hash of their
+    source; an executor that hasn't seen them answers 409 and the run is resent
+    with send_test_code=True.
+    """
+    job = {
+        "user_code": request.code,
+        "timeout": 10 # Example timeout, can be configurable
+    }
+    if request.test_code is not None:
+        job["test_hash"] = hashlib.sha256(request.test_code.encode("utf-8")).hexdigest()
+        if send_test_code:
+            job["test_code"] = request.test_code
+    return job
+
+def _executor_error(response: httpx.Response) -> HTTPException:
+    if response.status_code == 429:
+        # The executor is shedding load: pass its back-off hint on to the client
+        return HTTPException(
+            status_code=429,
+            detail="The code runner is busy right now. Please try again in a few seconds.",
+            headers={"Retry-After": response.headers.get("Retry-After", "1")},
+        )
+    return HTTPException(status_code=response.status_code, detail=f"Code executor returned an error: {response.text}")
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{CODE_EXECUTOR_URL}/execute",
-                json={
-                    "user_code": request.code,
-                    "test_code": request.test_code,
-                    "timeout": 10 # Example timeout, can be configurable
-                }
-            )
-            response.raise_for_status() # Raise an exception for bad status codes
-            executor_result = response.json()
-
-            # Map the executor's result to your schema
-            status_str = "error" # Default to error
-            if executor_result["returncode"] == 0 and not executor_result["stderr"] and not executor_result["error"]:
-                if "Tests passed" in executor_result["stdout"]:
-                    status_str = "success"
-                else:
-                    status_str = "attempted" # Code ran, but tests didn't explicitly pass
-            elif executor_result["returncode"] == 1 and ("AssertionError" in executor_result["stdout"] or "AssertionError" in executor_result["stderr"]):
-                status_str = "attempted" # Code ran, but tests failed due to assertion
-
-
-
-            # Update or create UserLessonCompletion with last attempted code and status
-            completion = db.query(models.UserLessonCompletion).filter(
-                models.UserLessonCompletion.user_id == current_user.id,
-                models.UserLessonCompletion.lesson_id == request.lesson_id
-            ).first()
-
-            if completion:
-                completion.last_attempted_code = request.code
-                completion.status = status_str
-                if status_str == "success":
-                    completion.completed_at = func.now()
+async def _run_on_executor(request: schemas.CodeExecutionRequest) -> dict:
+    """Runs a request on an executor and returns its raw result, raising HTTPException on failure."""
+    try:
+        response = await executor_pool.post("/execute", json=_executor_job(request))
+        if response.status_code == 409: # The executor hasn't seen these tests yet
+            response = await executor_pool.post("/execute", json=_executor_job(request, send_test_code=True))
+        response.raise_for_status() # Raise an exception for bad status codes
+        return response.json()
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Code executor service unavailable: {e}")
+    except httpx.HTTPStatusError as e:
+        raise _executor_error(e.response)
+
+def _graded_result(executor_result: dict) -> schemas.CodeExecutionResult:
+    # Map the executor's result to your schema
+    return schemas.CodeExecutionResult(
+        output=executor_result["stdout"],
+        error=executor_result["stderr"] or executor_result["error"],
+        status=_grade_executor_result(executor_result),
+        linter_output=executor_result.get("linter_output")
+    )
 
-            else:
-                completion = models.UserLessonCompletion(
-                    user_id=current_user.id,
-                    lesson_id=request.lesson_id,
-                    last_attempted_code=request.code,
-                    status=status_str,
-                    notes=None,
-                    bookmarked=False
-                )
-                if status_str == "success":
-                    completion.completed_at = func.now()
-                db.add(completion)
+@app.post("/execute-code/", response_model=schemas.CodeExecutionResult)
+async def execute_code(request: schemas.CodeExecutionRequest, current_user: auth.Principal = Depends(auth.get_current_user)):
+    await _check_execution_request(request)
+
+    try:
+        result = _graded_result(await _run_on_executor(request))
+        await _record_attempt(current_user.id, request.lesson_id, request.code, result.status)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
-            db.commit()
-            db.refresh(completion)
 
+async def _grade_job(request: schemas.CodeExecutionRequest, user_id: int) -> schemas.CodeExecutionResult:
+    result = _graded_result(await _run_on_executor(request))
+    await _record_attempt(user_id, request.lesson_id, request.code, result.status)
+    return result
 
-            return schemas.CodeExecutionResult(
-                output=executor_result["stdout"],
-                error=executor_result["stderr"] or executor_result["error"],
-                status=status_str
-            )
-        except httpx.RequestError as e:
+def _job_response(job) -> schemas.ExecutionJob:
+    return schemas.ExecutionJob(job_id=job.id, status=job.status, result=job.result, error=job.error)
+
+@app.post("/execute-code/jobs", response_model=schemas.ExecutionJob, status_code=status.HTTP_202_ACCEPTED)
+async def submit_execution_job(request: schemas.CodeExecutionRequest, current_user: auth.Principal = Depends(auth.get_current_user)):
+    """
+    Queues a run and returns its job id immediately. The result is graded and saved
+    in the background; fetch it from GET /execute-code/jobs/{job_id}.
+    """
+    await _check_execution_request(request)
+    try:
+        user_id = current_user.id
+        job = execution_jobs.submit(user_id, lambda: _grade_job(request, user_id))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return _job_response(job)
+
+@app.get("/execute-code/jobs/{job_id}", response_model=schemas.ExecutionJob)
+async def get_execution_job(job_id: str, wait: float = 0, current_user: auth.Principal = Depends(auth.get_current_user)):
+    """Returns a job's state; with ?wait=N, waits up to N seconds (at most 30) for it to finish."""
+    job = execution_jobs.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait > 0 and not job.finished:
+        await job.wait(min(wait, 30.0))
+    return _job_response(job)
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/execute-code/stream")
+async def execute_code_stream(request: schemas.CodeExecutionRequest, current_user: auth.Principal = Depends(auth.get_current_user)):
+    """
+    Runs code like /execute-code/, but relays output as Server-Sent Events while it
+    is produced: `stdout`/`stderr` events carry {"data": chunk}, and a final `result`
+    event carries the graded CodeExecutionResult (with an empty output).
+    """
+    await _check_execution_request(request)
+
+    client = executor_pool.client
+    stream_timeout = executor_pool.timeout_without_read_limit() # Output may pause for the whole run
+    node = executor_pool.acquire() # Counted as in flight until the relay below finishes
+    started = time.monotonic()
+    response = None
+    try:
+        executor_request = client.build_request("POST", f"{node.url}/execute/stream", json=_executor_job(request), timeout=stream_timeout)
+        response = await client.send(executor_request, stream=True)
+        if response.status_code == 409: # The executor hasn't seen these tests yet
+            await response.aclose()
+            executor_request = client.build_request("POST", f"{node.url}/execute/stream", json=_executor_job(request, send_test_code=True), timeout=stream_timeout)
+            response = await client.send(executor_request, stream=True)
+        if response.is_error:
+            await response.aread()
+            raise _executor_error(response)
+    except BaseException as e: # Including cancellation: the node must not stay counted as in flight
+        executor_pool.release(node, started, e)
+        if response is not None:
+            await response.aclose()
+        if isinstance(e, httpx.RequestError):
             raise HTTPException(status_code=503, detail=f"Code executor service unavailable: {e}")
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=e.response.status_code, detail=f"Code executor returned an error: {e.response.text}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
\ No newline at end of file
+        raise
+
+    user_id = current_user.id
+
+    async def relay():
+        # Only the flags needed for grading are kept, not the output itself
+        tails = {"stdout": "", "stderr": ""} # Per stream, so a marker can't be pieced together from both
+        stderr_seen = False
+        tests_passed = False
+        assertion_failed = False
+        stream_error = None
+        try:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] in ("stdout", "stderr"):
+                    scanned = tails[event["type"]] + event["data"]
+                    tests_passed = tests_passed or (event["type"] == "stdout" and "Tests passed" in scanned)
+                    assertion_failed = assertion_failed or "AssertionError" in scanned
+                    stderr_seen = stderr_seen or event["type"] == "stderr"
+                    tails[event["type"]] = scanned[-32:] # Markers may be split across chunks
+                    yield _sse_event(event["type"], {"data": event["data"]})
+                elif event["type"] == "result":
+                    error = event.get("error")
+                    assertion_failed = assertion_failed or "AssertionError" in (error or "")
+                    status_str = _grade_status(event["returncode"], stderr_seen, error, tests_passed, assertion_failed)
+                    await _record_attempt(user_id, request.lesson_id, request.code, status_str)
+                    result = schemas.CodeExecutionResult(
+                        output="",
+                        error=error,
+                        status=status_str,
+                        linter_output=event.get("linter_output")
+                    )
+                    yield _sse_event("result", result.model_dump())
+        except httpx.HTTPError as e:
+            stream_error = e
+            yield _sse_event("error", {"detail": f"Code executor stream failed: {e}"})
+        finally:
+            executor_pool.release(node, started, stream_error)
+            await response.aclose() # Returns the connection to the shared pool
+
+    return StreamingResponse(relay(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _batch_jobs(jobs: List[dict], send_test_code: bool) -> List[dict]:
+    """
+    Replaces each job's test_code with its hash. With send_test_code the source is
+    kept on the first job using it, which is enough for the executor to resolve the rest.
+    """
+    sent = set()
+    batch = []
+    for job in jobs:
+        job = dict(job)
+        test_code = job.pop("test_code", None)
+        if test_code is not None:
+            job["test_hash"] = hashlib.sha256(test_code.encode("utf-8")).hexdigest()
+            if send_test_code and job["test_hash"] not in sent:
+                sent.add(job["test_hash"])
+                job["test_code"] = test_code
+        batch.append(job)
+    return batch
+
+async def _post_batch(jobs: List[dict]) -> List[dict]:
+    try:
+        # A batch can take a while: no read timeout
+        timeout = executor_pool.timeout_without_read_limit()
+        response = await executor_pool.post("/execute/batch", json={"jobs": _batch_jobs(jobs, send_test_code=False)}, timeout=timeout)
+        if response.status_code == 409: # The executor hasn't seen some of these tests yet
+            response = await executor_pool.post("/execute/batch", json={"jobs": _batch_jobs(jobs, send_test_code=True)}, timeout=timeout)
+        response.raise_for_status()
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Code executor service unavailable: {e}")
+    except httpx.HTTPStatusError as e:
+        raise _executor_error(e.response)
+    return response.json()["results"]
+
+async def _execute_batch(jobs: List[dict]) -> List[dict]:
+    """
+    Runs many (user_code, test_code) jobs through the executors' batch endpoint,
+    in calls of at most CODE_EXECUTOR_MAX_BATCH_SIZE jobs, and returns the results
+    in job order. Calls are made one after another so a large batch doesn't take
+    over every executor at once.
+    """
+    if not executor_pool.nodes:
+        raise HTTPException(status_code=500, detail="CODE_EXECUTOR_URL environment variable is not set.")
+
+    results = []
+    for start in range(0, len(jobs), CODE_EXECUTOR_MAX_BATCH_SIZE):
+        results.extend(await _post_batch(jobs[start:start + CODE_EXECUTOR_MAX_BATCH_SIZE]))
+    return results
+
+@app.get("/executors/stats")
+async def get_executor_stats(current_user: auth.Principal = Depends(auth.get_current_admin_user)): # Admin protected
+    """Per-executor health, in-flight requests and average latency, plus connection pool utilization."""
+    return executor_pool.stats()
+
+@app.post("/lessons/validate", response_model=List[schemas.LessonValidation])
+async def validate_lessons(db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_admin_user)): # Protected by admin user
+    """Runs every lesson's code example against its tests in one executor batch."""
+    lessons = (await db.scalars(select(models.Lesson).where(models.Lesson.test_code.isnot(None), models.Lesson.code_example.isnot(None)).order_by(models.Lesson.id))).all()
+    results = await _execute_batch([
+        {"user_code": lesson.code_example, "test_code": lesson.test_code, "timeout": 10}
+        for lesson in lessons
+    ])
+    return [
+        schemas.LessonValidation(
+            lesson_id=lesson.id,
+            title=lesson.title,
+            status=_grade_executor_result(result),
+            error=result["stderr"] or result["error"],
+        )
+        for lesson, result in zip(lessons, results)
+    ]
+
+@app.post("/lessons/{lesson_id}/regrade", response_model=schemas.RegradeSummary)
+async def regrade_lesson(lesson_id: int, db: AsyncSession = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_admin_user)): # Protected by admin user
+    """
+    Re-runs every user's last attempt at a lesson against its current tests and
+    updates their status. Lessons marked "completed" through the completion
+    endpoint keep that status.
+    """
+    lesson = await db.get(models.Lesson, lesson_id)
+    if lesson is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    await progress_writer.flush() # Regrade the latest attempts, including ones not yet written
+    attempts = (await db.execute(select(
+        models.UserLessonCompletion.user_id,
+        models.UserLessonCompletion.last_attempted_code,
+        models.UserLessonCompletion.status,
+    ).where(
+        models.UserLessonCompletion.lesson_id == lesson_id,
+        models.UserLessonCompletion.last_attempted_code.isnot(None),
+        models.UserLessonCompletion.status != "completed",
+    ))).all()
+    test_code = lesson.test_code
+    # End the read transaction: the batch can take minutes, and must not hold a connection meanwhile
+    await db.commit()
+    results = await _execute_batch([
+        {"user_code": attempt.last_attempted_code, "test_code": test_code, "timeout": 10}
+        for attempt in attempts
+    ])
+
+    changed = 0
+    succeeded = 0
+    for attempt, result in zip(attempts, results):
+        status_str = _grade_executor_result(result)
+        if status_str != attempt.status:
+            values = {"status": status_str}
+            if status_str == "success":
+                values["completed_at"] = func.coalesce(models.UserLessonCompletion.completed_at, func.now())
+            # Only while the graded code is still the latest attempt: one saved during the regrade wins
+            written = await db.execute(update(models.UserLessonCompletion).where(
+                models.UserLessonCompletion.user_id == attempt.user_id,
+                models.UserLessonCompletion.lesson_id == lesson_id,
+                models.UserLessonCompletion.last_attempted_code == attempt.last_attempted_code,
+                models.UserLessonCompletion.status != "completed",
+            ).values(**values))
+            if written.rowcount == 0:
+                continue
+            changed += 1
+        succeeded += status_str == "success"
+    await db.commit()
+    return schemas.RegradeSummary(
+        lesson_id=lesson_id,
+        regraded=len(attempts),
+        changed=changed,
+        succeeded=succeeded,
+    )
@@ -0,0 +1,37 @@
+import os
+import sys
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from database import engine
+import models
+
+def migrate_schema(connection):
+    """
+    Brings an existing database up to the models. create_all only creates missing
+    tables, so this also adds the nullable columns and the indexes introduced since
+    a table was created. Safe to run repeatedly.
+    """
+    models.Base.metadata.create_all(connection)
+    inspector = inspect(connection)
+    for table in models.Base.metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns and column.nullable and column.server_default is None:
+                print(f"Adding column {table.name}.{column.name}")
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True) # Skips indexes limited to another dialect
+
+if __name__ == "__main__":
+    try:
+        print("Migrating database schema...")
+        with engine.begin() as connection:
+            migrate_schema(connection)
+        print("Database schema is up to date.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        sys.exit(1)
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
+from datetime import datetime, timezone
+
+def _utcnow():
+    return datetime.now(timezone.utc)
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -12,10 +16,18 @@ class Lesson(Base):
     code_example = Column(Text, nullable=True)
     prefill_code = Column(Text, nullable=True)
     test_code = Column(Text, nullable=True)
+    # Set in Python so the value is on the object after commit; Last-Modified for lesson responses
+    updated_at = Column(DateTime(timezone=True), nullable=True, default=_utcnow, onupdate=_utcnow)
 
     # Relationship to UserLessonCompletion
     completions = relationship("UserLessonCompletion", back_populates="lesson")
 
+    __table_args__ = (
+        Index("ix_lessons_title_id", "title", "id"), # Keyset pages ordered by title
+        # title_prefix LIKE on Postgres; elsewhere the title index already serves it
+        Index("ix_lessons_title_pattern", "title", postgresql_ops={"title": "text_pattern_ops"}).ddl_if(dialect="postgresql"),
+    )
+
 class User(Base):
     __tablename__ = "users"
 
@@ -29,6 +41,14 @@ class User(Base):
     # Relationship to UserLessonCompletion
     lesson_completions = relationship("UserLessonCompletion", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pages filtered by status; the unique email index covers ordering by email
+        Index("ix_users_is_active_id", "is_active", "id"),
+        Index("ix_users_is_admin_id", "is_admin", "id"),
+        # email_prefix LIKE on Postgres; elsewhere the unique email index already serves it
+        Index("ix_users_email_pattern", "email", postgresql_ops={"email": "text_pattern_ops"}).ddl_if(dialect="postgresql"),
+    )
+
 class UserLessonCompletion(Base):
     __tablename__ = "user_lesson_completions"
 
@@ -36,6 +56,7 @@ class UserLessonCompletion(Base):
     lesson_id = Column(Integer, ForeignKey("lessons.id"), primary_key=True)
     status = Column(String, default="started") # e.g., "started", "attempted", "completed"
     last_attempted_code = Column(Text, nullable=True) # Stores the last code submitted, regardless of correctness
+    last_attempted_at = Column(DateTime(timezone=True), nullable=True) # When that code was submitted; an older queued write can't replace it
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True) # Only set on completion
     notes = Column(Text, nullable=True)  # New field for user notes
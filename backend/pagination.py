@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination. A page is the rows after the last one the client saw
+in (sort column, id) order, so every page is an index range scan no matter how
+deep the client pages, and rows inserted meanwhile don't shift later pages.
+Cursors are opaque to clients: base64 of the ordering and the last row's key.
+"""
+import base64
+import binascii
+import json
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(order_by: str, descending: bool, value: Any, row_id: int) -> str:
+    payload = json.dumps([order_by, descending, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, order_by: str, descending: bool) -> Tuple[Any, int]:
+    """Returns the (sort value, id) a cursor points after; it must come from the same ordering."""
+    try:
+        cursor_order_by, cursor_descending, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor("Invalid cursor")
+    if cursor_order_by != order_by or cursor_descending != descending or not isinstance(row_id, int):
+        raise InvalidCursor("Cursor does not match the requested ordering")
+    return value, row_id
+
+def keyset_page(query, sort_column, id_column, cursor: Optional[str], order_by: str, descending: bool, limit: int):
+    """
+    Orders query by (sort_column, id_column) and restricts it to the page after
+    cursor. One extra row is fetched so callers can tell whether there is a next page.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor, order_by, descending)
+        if sort_column is id_column:
+            query = query.where(id_column < row_id if descending else id_column > row_id)
+        elif descending:
+            query = query.where(or_(sort_column < value, and_(sort_column == value, id_column < row_id)))
+        else:
+            query = query.where(or_(sort_column > value, and_(sort_column == value, id_column > row_id)))
+    columns = [sort_column] if sort_column is id_column else [sort_column, id_column]
+    return query.order_by(*(column.desc() if descending else column for column in columns)).limit(limit + 1)
+
+def next_cursor(rows: list, order_by: str, descending: bool, limit: int) -> Optional[str]:
+    """Trims the extra row fetched by keyset_page and returns the cursor for the page after rows, if any."""
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(order_by, descending, getattr(last, order_by), last.id)
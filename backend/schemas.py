@@ -45,6 +45,7 @@ class Lesson(BaseModel):
     code_example: Optional[str] = None
     prefill_code: Optional[str] = None
     test_code: Optional[str] = None
+    updated_at: Optional[datetime] = None
     completions: List["UserLessonCompletion"] = [] # Forward reference
 
     class Config:
@@ -62,6 +63,24 @@ class CodeExecutionResult(BaseModel):
     status: str = "success"
     linter_output: Optional[str] = None # New field for linter output
 
+class ExecutionJob(BaseModel):
+    job_id: str
+    status: str # "queued", "running", "done" or "failed"
+    result: Optional[CodeExecutionResult] = None
+    error: Optional[str] = None
+
+class LessonValidation(BaseModel):
+    lesson_id: int
+    title: str
+    status: str # Grade of the lesson's code example against its tests
+    error: Optional[str] = None
+
+class RegradeSummary(BaseModel):
+    lesson_id: int
+    regraded: int
+    changed: int
+    succeeded: int
+
 # New schemas for UserLessonCompletion
 class UserLessonCompletionBase(BaseModel):
     user_id: int
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+import pytest
+import executor_app
+
+# Use the executor_client fixture from conftest.py
+
+# Test a passing run through the fork server
+@pytest.mark.asyncio
+async def test_execute_print_and_test(executor_client):
+    response = executor_client.post("/execute", json={
+        "user_code": "print('Hello')",
+        "test_code": "assert user_printed_output == 'Hello\\n'\nprint('Tests passed')"
+    })
+    assert response.status_code == 200
+    assert response.json()["returncode"] == 0
+    assert response.json()["stdout"] == "Hello\nTests passed\n"
+
+# Test that a run cancelled while its child is being spawned kills the child and closes every pipe
+@pytest.mark.asyncio
+async def test_run_cancelled_during_spawn_kills_child(executor_client, monkeypatch):
+    fork_server = executor_app.fork_server
+    spawn = fork_server._spawn
+    spawned = []
+
+    def slow_spawn(job, fds):
+        time.sleep(0.3) # The caller is cancelled meanwhile
+        spawned.append(spawn(job, fds))
+        return spawned[-1]
+
+    monkeypatch.setattr(fork_server, "_spawn", slow_spawn)
+
+    async def run_and_cancel():
+        open_fds = len(os.listdir("/proc/self/fd"))
+        task = asyncio.ensure_future(fork_server.run({"source": "import time\ntime.sleep(30)", "limits": {}}, 30))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.5) # Until the spawn thread finishes
+        return open_fds, len(os.listdir("/proc/self/fd"))
+
+    open_fds_before, open_fds_after = executor_client.portal.call(run_and_cancel)
+    assert open_fds_after == open_fds_before
+    time.sleep(0.2)
+    with pytest.raises(ProcessLookupError):
+        os.kill(spawned[0], 0)
+
+# Test that a syntax error is reported like the interpreter would
+@pytest.mark.asyncio
+async def test_execute_syntax_error(executor_client):
+    response = executor_client.post("/execute", json={"user_code": "print('Hello'"})
+    assert response.status_code == 200
+    assert response.json()["returncode"] == 1
+    assert "SyntaxError: '(' was never closed" in response.json()["error"]
+
+# Test that runaway code is killed after the timeout
+@pytest.mark.asyncio
+async def test_execute_timeout(executor_client):
+    response = executor_client.post("/execute", json={
+        "user_code": "print('start')\nwhile True:\n    pass",
+        "timeout": 1
+    })
+    assert response.status_code == 200
+    assert response.json()["returncode"] == -1
+    assert response.json()["stdout"] == "start\n"
+    assert response.json()["error"] == "User code execution timed out after 1 seconds."
+
+# Test that code leaving through os._exit() reports its own exit status, not a kill
+@pytest.mark.asyncio
+async def test_execute_os_exit_reports_exit_status(executor_client):
+    for status in (0, 3):
+        response = executor_client.post("/execute", json={"user_code": f"import os\nprint('bye', flush=True)\nos._exit({status})"})
+        assert response.status_code == 200
+        assert response.json()["returncode"] == status
+        assert response.json()["stdout"] == "bye\n"
+
+# Test that the fork server is restarted if the zygote dies
+@pytest.mark.asyncio
+async def test_fork_server_restarts_zygote(executor_client):
+    executor_app.fork_server._process.kill()
+    executor_app.fork_server._process.wait()
+    response = executor_client.post("/execute", json={"user_code": "print(40 + 2)"})
+    assert response.status_code == 200
+    assert response.json()["stdout"] == "42\n"
+
+# Test that test code can inspect the user's namespace and return value
+@pytest.mark.asyncio
+async def test_execute_exposes_execution_scope(executor_client):
+    response = executor_client.post("/execute", json={
+        "user_code": "def multiply(a, b):\n    print(a * b)\n    return a * b",
+        "test_code": (
+            "assert callable(execution_scope['multiply'])\n"
+            "_user_return_value_capture = execution_scope['multiply'](6, 7)\n"
+            "assert user_return_value == 42\n"
+            "assert user_printed_output.strip() == '42'\n"
+            "print('Tests passed')"
+        )
+    })
+    assert response.status_code == 200
+    assert response.json()["returncode"] == 0
+    assert response.json()["stdout"] == "42\nTests passed\n"
+
+# Test that a failing assertion is reported against the test code
+@pytest.mark.asyncio
+async def test_execute_test_assertion_fails(executor_client):
+    response = executor_client.post("/execute", json={
+        "user_code": "print('Wrong')",
+        "test_code": "assert user_printed_output == 'Correct\\n'"
+    })
+    assert response.status_code == 200
+    assert response.json()["returncode"] == 1
+    assert response.json()["stdout"] == "Wrong\n"
+    assert 'File "<test_code>", line 1' in response.json()["error"]
+    assert "AssertionError" in response.json()["error"]
+
+# Test that lint findings are returned alongside the run result
+@pytest.mark.asyncio
+async def test_execute_returns_linter_output(executor_client):
+    response = executor_client.post("/execute", json={"user_code": "import os\nx=1\nprint(x)"})
+    assert response.status_code == 200
+    assert response.json()["stdout"] == "1\n"
+    assert response.json()["linter_output"] == (
+        "<user_code>:1:1: F401 'os' imported but unused\n"
+        "<user_code>:2:2: E225 missing whitespace around operator\n"
+    )
+
+# Test that identical deterministic submissions are served from the result cache
+@pytest.mark.asyncio
+async def test_execute_result_cache(executor_client):
+    before = executor_client.get("/cache/stats").json()
+    body = {"user_code": "print(sum(range(10)))", "test_code": "assert user_printed_output == '45\\n'"}
+    first = executor_client.post("/execute", json=body)
+    second = executor_client.post("/execute", json=body)
+    assert first.json() == second.json()
+    after = executor_client.get("/cache/stats").json()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+    # Code that uses randomness is never cached
+    executor_client.post("/execute", json={"user_code": "import random\nprint(random.random())"})
+    assert executor_client.get("/cache/stats").json()["skipped_nondeterministic"] == after["skipped_nondeterministic"] + 1
+
+# Test that indirect ways of reaching randomness or builtins also skip the result cache
+@pytest.mark.asyncio
+async def test_execute_result_cache_skips_dynamic_imports(executor_client):
+    from executor_cache import is_deterministic
+
+    for source in (
+        "print(__import__('random').random())",
+        "import importlib\nprint(importlib.import_module('random').random())",
+        "print(eval('__imp' + 'ort__(\"random\")').random())",
+        "exec('import random')",
+        "code = compile('import random', 'x', 'exec')",
+        "print(getattr(__builtins__, 'op' + 'en'))",
+        "print(globals()['__builtins__'])",
+        "import sys\nprint(sys.modules)",
+        "print(getattr(object, name))",
+        "print(().__class__.__base__.__subclasses__())",
+    ):
+        assert not is_deterministic(source), source
+    assert is_deterministic("print(getattr(str, 'upper')('a'))")
+
+    skipped = executor_client.get("/cache/stats").json()["skipped_nondeterministic"]
+    first = executor_client.post("/execute", json={"user_code": "print(__import__('random').random())"}).json()
+    second = executor_client.post("/execute", json={"user_code": "print(__import__('random').random())"}).json()
+    assert first["stdout"] != second["stdout"]
+    assert executor_client.get("/cache/stats").json()["skipped_nondeterministic"] == skipped + 2
+
+# Test that a result cached under old run limits isn't served once they change
+@pytest.mark.asyncio
+async def test_execute_result_cache_keyed_by_limits(executor_client, monkeypatch):
+    body = {"user_code": "print('x' * 2000)"}
+    executor_client.post("/execute", json=body)
+    monkeypatch.setattr(executor_app, "EXECUTOR_MAX_STDOUT_BYTES", 1024)
+    response = executor_client.post("/execute", json=body)
+    assert response.json()["error"].startswith("Output limit exceeded")
+
+# Test that the streaming endpoint emits output chunks followed by the result
+@pytest.mark.asyncio
+async def test_execute_stream(executor_client):
+    response = executor_client.post("/execute/stream", json={
+        "user_code": "for i in range(3):\n    print(i)",
+        "test_code": "print('Tests passed')"
+    })
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert "".join(event["data"] for event in events if event["type"] == "stdout") == "0\n1\n2\nTests passed\n"
+    assert events[-1]["type"] == "result"
+    assert events[-1]["returncode"] == 0
+    assert "stdout" not in events[-1]
+
+# Test that requests are rejected with 429 once the execution queue is full
+@pytest.mark.asyncio
+async def test_execute_rejects_when_overloaded(executor_client, monkeypatch):
+    admission = executor_app.AdmissionController(max_concurrent=1, max_queue=0, max_wait=1)
+    monkeypatch.setattr(executor_app, "admission", admission)
+    admitted_at = await admission.acquire() # Occupy the only slot
+
+    response = executor_client.post("/execute", json={"user_code": "print('queued')"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert admission.stats()["rejected_queue_full"] == 1
+
+    admission.release(admitted_at)
+    response = executor_client.post("/execute", json={"user_code": "print('queued')"})
+    assert response.status_code == 200
+
+# Test that a run printing past the output cap is truncated and stopped
+@pytest.mark.asyncio
+async def test_execute_caps_runaway_output(executor_client, monkeypatch):
+    monkeypatch.setattr(executor_app, "EXECUTOR_MAX_STDOUT_BYTES", 1024)
+    response = executor_client.post("/execute", json={"user_code": "while True:\n    print('x' * 100)", "timeout": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert "[stdout truncated after 1024 bytes]" in data["stdout"]
+    assert len(data["stdout"]) < 1200
+    assert data["error"].startswith("Output limit exceeded")
+
+# Test that the per-run memory limit applies to user code
+@pytest.mark.asyncio
+async def test_execute_enforces_memory_limit(executor_client):
+    response = executor_client.post("/execute", json={"user_code": "data = bytearray(1024 * 1024 * 1024)", "timeout": 5})
+    assert response.status_code == 200
+    assert "MemoryError" in response.json()["stderr"]
+
+# Test that batch results come back in job order
+@pytest.mark.asyncio
+async def test_execute_batch_returns_results_in_order(executor_client):
+    jobs = [
+        {"user_code": f"import time\ntime.sleep({0.3 - i * 0.1})\nprint({i})", "timeout": 5}
+        for i in range(3)
+    ] + [{"user_code": "x = 1", "test_code": "assert execution_scope['x'] == 2", "timeout": 5}]
+    response = executor_client.post("/execute/batch", json={"jobs": jobs})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["stdout"] for result in results[:3]] == ["0\n", "1\n", "2\n"]
+    assert "AssertionError" in results[3]["stderr"]
+    assert executor_client.get("/admission/stats").json()["active"] == 0
+
+# Test that each running batch job holds an admission slot and stays out of Retry-After
+@pytest.mark.asyncio
+async def test_execute_batch_holds_a_slot_per_running_job(executor_client, monkeypatch):
+    admission = executor_app.AdmissionController(max_concurrent=2, max_queue=0, max_wait=1)
+    monkeypatch.setattr(executor_app, "admission", admission)
+    monkeypatch.setattr(executor_app, "EXECUTOR_BATCH_CONCURRENCY", 2)
+    jobs = [{"user_code": f"import time\ntime.sleep(0.5)\nprint({i})", "timeout": 5} for i in range(2)]
+
+    async def run_batch_and_interactive():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=executor_app.app), base_url="http://executor") as client:
+            batch = asyncio.ensure_future(client.post("/execute/batch", json={"jobs": jobs}))
+            await asyncio.sleep(0.2)
+            assert admission.stats()["batch_active"] == 2
+            # Both slots are busy with batch jobs and the queue is empty: shed, don't pile onto the fork server
+            interactive = await client.post("/execute", json={"user_code": "print('interactive')"})
+            return (await batch), interactive
+
+    batch, interactive = executor_client.portal.call(run_batch_and_interactive)
+    assert [result["stdout"] for result in batch.json()["results"]] == ["0\n", "1\n"]
+    assert interactive.status_code == 429
+    stats = admission.stats()
+    assert stats["active"] == 0 and stats["batch_active"] == 0
+    assert stats["average_run_seconds"] == 1.0 # Batch timings don't feed Retry-After
+
+# Test that a streamed batch emits results as jobs finish
+@pytest.mark.asyncio
+async def test_execute_batch_streams_as_completed(executor_client):
+    jobs = [{"user_code": "import time\ntime.sleep(0.5)\nprint('slow')", "timeout": 5}, {"user_code": "print('fast')", "timeout": 5}]
+    response = executor_client.post("/execute/batch", json={"jobs": jobs, "stream": True})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines() if line]
+    assert {row["index"]: row["stdout"] for row in rows} == {0: "slow\n", 1: "fast\n"}
+
+# Test the health endpoint used by the backend's load balancing
+@pytest.mark.asyncio
+async def test_health(executor_client):
+    response = executor_client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+# Test that tests can be referenced by hash once the executor has seen their source
+@pytest.mark.asyncio
+async def test_execute_accepts_test_hash_after_source_was_sent(executor_client):
+    test_code = "assert user_printed_output == 'ok\\n'\nprint('Tests passed')"
+    test_hash = hashlib.sha256(test_code.encode("utf-8")).hexdigest()
+
+    response = executor_client.post("/execute", json={"user_code": "print('ok')", "test_hash": test_hash})
+    assert response.status_code == 409
+
+    response = executor_client.post("/execute", json={"user_code": "print('ok')", "test_code": test_code, "test_hash": test_hash})
+    assert "Tests passed" in response.json()["stdout"]
+
+    response = executor_client.post("/execute", json={"user_code": "print('ok') ", "test_hash": test_hash})
+    assert response.status_code == 200
+    assert "Tests passed" in response.json()["stdout"]
+
+# Test that runs and their phases show up in the Prometheus metrics
+@pytest.mark.asyncio
+async def test_metrics(executor_client):
+    executor_client.post("/execute", json={"user_code": "import random\nprint(random.random())", "test_code": "assert False"})
+    response = executor_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'executor_runs_total{outcome="assertion"}' in body
+    for phase in ("spawn", "lint", "user", "test"):
+        assert f'executor_phase_seconds_count{{phase="{phase}"}}' in body
+    assert "executor_active_runs 0" in body
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+
+from executor_client import ExecutorPool
+
+# Test that routing prefers the node with fewer requests in flight
+@pytest.mark.asyncio
+async def test_acquire_prefers_less_loaded_node():
+    pool = ExecutorPool(["http://a", "http://b"])
+    busy, idle = pool.nodes
+    busy.in_flight = 5
+    for _ in range(10):
+        node = pool.acquire()
+        assert node is idle
+        pool.release(node, 0.0)
+
+# Test that repeated connection failures eject a node
+@pytest.mark.asyncio
+async def test_connection_failures_eject_node():
+    pool = ExecutorPool(["http://a", "http://b"], failure_threshold=2)
+    bad = pool.nodes[0]
+    for _ in range(2):
+        bad.in_flight += 1
+        pool.release(bad, 0.0, httpx.ConnectError("refused"))
+    assert not bad.healthy
+    assert all(pool.acquire() is pool.nodes[1] for _ in range(10))
+
+# Test that a request that could not connect is retried on another node
+@pytest.mark.asyncio
+async def test_post_retries_connect_error_on_another_node():
+    def handler(request):
+        if request.url.host == "down":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    pool = ExecutorPool(["http://down", "http://up"])
+    pool._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    for _ in range(5):
+        response = await pool.post("/execute", json={})
+        assert response.json() == {"host": "up"}
+    assert all(node.in_flight == 0 for node in pool.nodes)
+    await pool.stop()
+
+# Test that a failed health check ejects a node until a check succeeds
+@pytest.mark.asyncio
+async def test_failed_health_check_ejects_until_recovery():
+    status = {"code": 503}
+    pool = ExecutorPool(["http://a"])
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(status["code"]))) as client:
+        await pool.check_health(client)
+        assert not pool.nodes[0].healthy
+        status["code"] = 200
+        await pool.check_health(client)
+        assert pool.nodes[0].healthy
+
+# Test that an unexpected health check error ejects the node instead of ending the checks
+@pytest.mark.asyncio
+async def test_unexpected_health_check_error_ejects_without_stopping_checks():
+    def handler(request):
+        raise ValueError("bad response")
+
+    pool = ExecutorPool(["http://a"])
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await pool.check_health(client)
+    assert not pool.nodes[0].healthy
+    assert pool.nodes[0].last_error == "bad response"
+
+# Test that waiting for a free connection isn't blamed on the node
+@pytest.mark.asyncio
+async def test_pool_timeout_does_not_count_against_node():
+    pool = ExecutorPool(["http://a"])
+    node = pool.acquire()
+    pool.release(node, 0.0, httpx.PoolTimeout("no free connection"))
+    assert node.failures == 0
+    assert pool.stats()["connections"]["pool_timeouts"] == 1
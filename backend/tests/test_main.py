@@ -684,3 +684,560 @@ async def test_delete_user_account(client, session):
     # Verify user is actually deleted from DB
     db_user = session.query(models.User).filter(models.User.email == "deleter@example.com").first()
     assert db_user is None
+
+# Test the asynchronous job API
+@pytest.mark.asyncio
+async def test_execution_job_is_graded_in_background(client, session, monkeypatch):
+    import main
+    from executor_client import ExecutorNode
+
+    async def fake_run_on_executor(request):
+        return {"stdout": "Hello\nTests passed\n", "stderr": "", "returncode": 0, "error": None, "linter_output": ""}
+
+    monkeypatch.setattr(main, "_run_on_executor", fake_run_on_executor)
+    monkeypatch.setattr(main.executor_pool, "nodes", [ExecutorNode("http://executor")])
+    client.post("/signup/", json={"email": "jobs@example.com", "password": "jobspassword", "name": "Jobs User"})
+    token = client.post("/token", data={"username": "jobs@example.com", "password": "jobspassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    lesson = models.Lesson(title="Job Lesson", content="Content")
+    session.add(lesson)
+    session.commit()
+
+    response = client.post("/execute-code/jobs", json={"lesson_id": lesson.id, "code": "print('Hello')"}, headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    response = client.get(f"/execute-code/jobs/{job_id}?wait=5", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert response.json()["result"]["status"] == "success"
+    client.portal.call(main.progress_writer.flush) # Progress is written behind the response
+    completion = session.query(models.UserLessonCompletion).filter_by(lesson_id=lesson.id).first()
+    assert completion.status == "success"
+
+    assert client.get("/execute-code/jobs/unknown", headers=headers).status_code == 404
+
+# Test per-request query counts and N+1 detection
+@pytest.mark.asyncio
+async def test_db_instrumentation_reports_queries(client, session, monkeypatch):
+    import db_instrumentation
+    from tests.conftest import async_engine
+
+    db_instrumentation.install(async_engine.sync_engine)
+    monkeypatch.setattr(db_instrumentation, "SAMPLE_RATE", 1.0)
+    response = client.get("/lessons/")
+    assert response.status_code == 200
+    assert response.headers["X-DB-Query-Count"] == "1"
+    assert float(response.headers["X-DB-Time-Ms"]) >= 0
+
+    stats = db_instrumentation.RequestQueryStats()
+    for _ in range(5):
+        stats.record("SELECT * FROM lesson_completions WHERE user_id = ?", 0.001)
+    stats.record("SELECT * FROM users", 0.001)
+    assert stats.repeated_statements(5) == [("SELECT * FROM lesson_completions WHERE user_id = ?", 5)]
+
+    monkeypatch.setattr(db_instrumentation, "SAMPLE_RATE", 0.0)
+    assert "X-DB-Query-Count" not in client.get("/lessons/").headers
+
+# Test that lesson edits invalidate the lesson cache
+@pytest.mark.asyncio
+async def test_lesson_cache_invalidated_by_update(client, session):
+    client.post("/signup/", json={"email": "cacheadmin@example.com", "password": "adminpassword", "name": "Cache Admin"})
+    db_user = session.query(models.User).filter(models.User.email == "cacheadmin@example.com").first()
+    db_user.is_admin = True
+    session.commit()
+    token = client.post("/token", data={"username": "cacheadmin@example.com", "password": "adminpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    lesson_data = {"title": "Cached", "content": "v1", "code_example": "", "prefill_code": "", "test_code": ""}
+    lesson_id = client.post("/lessons/", json=lesson_data, headers=headers).json()["id"]
+    assert client.get(f"/lessons/{lesson_id}").json()["content"] == "v1"
+    assert [lesson["title"] for lesson in client.get("/lessons/").json()] == ["Cached"]
+
+    # A direct write isn't seen until the cache is invalidated
+    session.query(models.Lesson).filter(models.Lesson.id == lesson_id).update({"title": "Changed behind the cache"})
+    session.commit()
+    assert client.get(f"/lessons/{lesson_id}").json()["title"] == "Cached"
+
+    client.put(f"/lessons/{lesson_id}", json={**lesson_data, "content": "v2"}, headers=headers)
+    assert client.get(f"/lessons/{lesson_id}").json()["content"] == "v2"
+    assert client.get("/lessons/").json()[0]["content"] == "v2"
+    assert client.get("/lessons/999").status_code == 404
+
+# Test keyset pagination of lessons
+@pytest.mark.asyncio
+async def test_lessons_keyset_pagination(client, session):
+    for title in ["Beta", "Delta", "Alpha 2", "Gamma", "Alpha"]:
+        session.add(models.Lesson(title=title, content="..."))
+    session.commit()
+
+    titles, cursor = [], None
+    while True:
+        params = {"limit": 2, "order_by": "title"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/lessons/", params=params)
+        assert response.status_code == 200
+        titles += [lesson["title"] for lesson in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert titles == ["Alpha", "Alpha 2", "Beta", "Delta", "Gamma"]
+
+    response = client.get("/lessons/", params={"title_prefix": "Alpha", "order_by": "title", "descending": True})
+    assert [lesson["title"] for lesson in response.json()] == ["Alpha 2", "Alpha"]
+    assert len(client.get("/lessons/").json()) == 5 # Unpaginated list is unchanged
+    assert client.get("/lessons/", params={"limit": 2, "cursor": "not-a-cursor"}).status_code == 400
+
+# Test keyset pagination and filters for users
+@pytest.mark.asyncio
+async def test_users_keyset_pagination_and_filters(client, session):
+    for i in range(5):
+        client.post("/signup/", json={"email": f"page{i}@example.com", "password": "password", "name": f"Page {i}"})
+    admin = session.query(models.User).filter(models.User.email == "page0@example.com").first()
+    admin.is_admin = True
+    session.commit()
+    token = client.post("/token", data={"username": "page0@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    first = client.get("/users/", params={"limit": 3}, headers=headers)
+    assert [user["email"] for user in first.json()] == ["page0@example.com", "page1@example.com", "page2@example.com"]
+    assert first.json()[0]["lesson_completions"] == []
+    second = client.get("/users/", params={"limit": 3, "cursor": first.headers["X-Next-Cursor"]}, headers=headers)
+    assert [user["email"] for user in second.json()] == ["page3@example.com", "page4@example.com"]
+    assert "X-Next-Cursor" not in second.headers
+
+    admins = client.get("/users/", params={"is_admin": True}, headers=headers).json()
+    assert [user["email"] for user in admins] == ["page0@example.com"]
+    # Search is a case-insensitive substring of the email or the name
+    assert [user["email"] for user in client.get("/users/", params={"search": "PAGE3@"}, headers=headers).json()] == ["page3@example.com"]
+    assert [user["email"] for user in client.get("/users/", params={"search": "ge 4"}, headers=headers).json()] == ["page4@example.com"]
+    assert client.get("/users/", params={"search": "%"}, headers=headers).json() == []
+    # A cursor only applies to the ordering it was issued for
+    assert client.get("/users/", params={"limit": 3, "order_by": "email", "cursor": first.headers["X-Next-Cursor"]}, headers=headers).status_code == 400
+
+# Test ETag and Last-Modified revalidation of lessons
+@pytest.mark.asyncio
+async def test_lesson_conditional_get(client, session):
+    lesson = models.Lesson(title="Conditional", content="Long markdown")
+    session.add(lesson)
+    session.commit()
+
+    response = client.get(f"/lessons/{lesson.id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert "max-age" in response.headers["Cache-Control"]
+    assert response.json()["updated_at"]
+
+    not_modified = client.get(f"/lessons/{lesson.id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get(f"/lessons/{lesson.id}", headers={"If-Modified-Since": response.headers["Last-Modified"]}).status_code == 304
+    assert client.get(f"/lessons/{lesson.id}", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    listing = client.get("/lessons/")
+    assert client.get("/lessons/", headers={"If-None-Match": listing.headers["ETag"]}).status_code == 304
+
+# Test that lessons are served precompressed
+@pytest.mark.asyncio
+async def test_lesson_served_precompressed(client, session):
+    lesson = models.Lesson(title="Compressed", content="Some long markdown. " * 200)
+    session.add(lesson)
+    session.commit()
+
+    plain = client.get(f"/lessons/{lesson.id}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    import lesson_cache
+    for encoding in ("gzip", "br") if lesson_cache.brotli is not None else ("gzip",):
+        response = client.get(f"/lessons/{lesson.id}", headers={"Accept-Encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(plain.content)
+        assert response.json() == plain.json() # Decoded by the client
+        assert response.headers["ETag"] != plain.headers["ETag"]
+        assert client.get(f"/lessons/{lesson.id}", headers={"Accept-Encoding": encoding, "If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get(f"/lessons/{lesson.id}", headers={"Accept-Encoding": "br;q=0, gzip"}).headers["content-encoding"] == "gzip"
+
+# Test that user changes invalidate cached principals
+@pytest.mark.asyncio
+async def test_principal_cache_invalidated_on_user_changes(client, session):
+    import auth
+
+    for email in ("principal-admin@example.com", "principal@example.com"):
+        client.post("/signup/", json={"email": email, "password": "password", "name": "Principal"})
+    admin = session.query(models.User).filter(models.User.email == "principal-admin@example.com").first()
+    admin.is_admin = True
+    session.commit()
+    admin_headers = {"Authorization": "Bearer " + client.post("/token", data={"username": "principal-admin@example.com", "password": "password"}).json()["access_token"]}
+    user_headers = {"Authorization": "Bearer " + client.post("/token", data={"username": "principal@example.com", "password": "password"}).json()["access_token"]}
+    user_id = client.get("/users/me/", headers=user_headers).json()["id"]
+
+    hits = auth.principal_cache.hits
+    assert client.get("/users/me/lesson-completions", headers=user_headers).status_code == 200
+    assert auth.principal_cache.hits == hits + 1 # No token decode or user lookup
+
+    assert client.get("/users/", headers=user_headers).status_code == 403
+    client.put(f"/users/{user_id}", json={"is_admin": True}, headers=admin_headers)
+    assert client.get("/users/", headers=user_headers).status_code == 200 # Promotion applies to the existing token
+
+    client.delete(f"/users/{user_id}", headers=admin_headers)
+    assert client.get("/users/me/lesson-completions", headers=user_headers).status_code == 401
+
+# Test that logins are shed while password hashing is saturated
+@pytest.mark.asyncio
+async def test_login_shed_when_password_hashing_is_saturated(client, session, monkeypatch):
+    import auth
+
+    client.post("/signup/", json={"email": "storm@example.com", "password": "password", "name": "Storm"})
+    monkeypatch.setattr(auth.password_hasher, "max_pending", 0)
+    response = client.post("/token", data={"username": "storm@example.com", "password": "password"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    monkeypatch.setattr(auth.password_hasher, "max_pending", 64)
+    assert client.post("/token", data={"username": "storm@example.com", "password": "password"}).status_code == 200
+
+# Test that completion writes are single upserts
+@pytest.mark.asyncio
+async def test_completion_writes_are_upserts(client, session):
+    lesson = models.Lesson(title="Upsert", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "upsert@example.com", "password": "password", "name": "Upsert"})
+    token = client.post("/token", data={"username": "upsert@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    first = client.post(f"/lessons/{lesson.id}/start", headers=headers)
+    assert first.status_code == 200
+    assert first.json()["status"] == "started"
+    assert first.json()["started_at"] is not None
+
+    completion = {"user_id": 0, "lesson_id": lesson.id, "status": "completed", "last_attempted_code": "print(1)", "notes": "n", "bookmarked": True}
+    completed = client.put(f"/lessons/{lesson.id}/completion", json=completion, headers=headers).json()
+    assert completed["status"] == "completed" and completed["completed_at"] is not None
+
+    # Starting again leaves the record alone; saving again keeps the original completion time
+    assert client.post(f"/lessons/{lesson.id}/start", headers=headers).json()["status"] == "completed"
+    again = client.put(f"/lessons/{lesson.id}/completion", json={**completion, "notes": "edited"}, headers=headers).json()
+    assert again["notes"] == "edited" and again["completed_at"] == completed["completed_at"]
+    reopened = client.put(f"/lessons/{lesson.id}/completion", json={**completion, "status": "started"}, headers=headers).json()
+    assert reopened["completed_at"] is None
+    assert session.query(models.UserLessonCompletion).count() == 1
+
+    assert client.post("/lessons/999/start", headers=headers).status_code == 404
+
+# Test that queued attempts are coalesced per lesson
+@pytest.mark.asyncio
+async def test_progress_writer_coalesces_attempts(client, session):
+    import main
+
+    lesson = models.Lesson(title="Write-behind", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "writer@example.com", "password": "password", "name": "Writer"})
+    user_id = session.query(models.User).filter(models.User.email == "writer@example.com").first().id
+
+    writer = main.progress_writer
+    flushes = writer.flushes
+    for code, status in (("print(1)", "attempted"), ("print(2)", "success"), ("print(3)", "attempted")):
+        client.portal.call(writer.record, user_id, lesson.id, code, status)
+    assert session.query(models.UserLessonCompletion).count() == 0 # Not written yet
+    client.portal.call(writer.flush)
+    assert writer.flushes == flushes + 1
+
+    completion = session.query(models.UserLessonCompletion).one()
+    assert completion.last_attempted_code == "print(3)"
+    assert completion.status == "attempted"
+    assert completion.completed_at is not None # The success in between still counts
+
+    client.portal.call(writer.record, user_id, lesson.id, "print(4)", "error")
+    client.portal.call(writer.flush)
+    session.expire_all()
+    completion = session.query(models.UserLessonCompletion).one()
+    assert completion.last_attempted_code == "print(4)" and completion.completed_at is not None
+
+# Test the SSE relay of streamed execution output
+@pytest.mark.asyncio
+async def test_execute_code_stream_relays_sse(client, session, monkeypatch):
+    import json
+    import httpx
+    import main
+    from executor_client import ExecutorPool
+
+    events = [
+        {"type": "stdout", "data": "Assertion"},
+        {"type": "stderr", "data": "Error: raised by the user's code\n"}, # Not an AssertionError once split per stream
+        {"type": "stdout", "data": "done\n"},
+        {"type": "result", "returncode": 1, "error": "ValueError", "linter_output": ""},
+    ]
+    body = "".join(json.dumps(event) + "\n" for event in events)
+    pool = ExecutorPool(["http://executor"], health_interval=0)
+    pool._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)))
+    monkeypatch.setattr(main, "executor_pool", pool)
+
+    lesson = models.Lesson(title="Streamed", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "stream@example.com", "password": "password", "name": "Stream"})
+    token = client.post("/token", data={"username": "stream@example.com", "password": "password"}).json()["access_token"]
+
+    response = client.post("/execute-code/stream", json={"lesson_id": lesson.id, "code": "print('done')"}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("\n\n")
+    frames = [frame.split("\n") for frame in response.text.strip().split("\n\n")]
+    assert [frame[0] for frame in frames] == ["event: stdout", "event: stderr", "event: stdout", "event: result"]
+    assert all(len(frame) == 2 and frame[1].startswith("data: ") for frame in frames)
+    assert json.loads(frames[0][1][len("data: "):]) == {"data": "Assertion"}
+    result = json.loads(frames[-1][1][len("data: "):])
+    assert result == {"output": "", "error": "ValueError", "status": "error", "linter_output": ""}
+    assert pool.nodes[0].in_flight == 0
+
+    client.portal.call(main.progress_writer.flush)
+    assert session.query(models.UserLessonCompletion).filter_by(lesson_id=lesson.id).one().status == "error"
+
+def _fake_batch_executor(batches, during_batch=None):
+    """An executor /execute/batch that remembers test sources by hash and passes code printing 42."""
+    import json
+    import httpx
+
+    sources = {}
+
+    def handler(request):
+        jobs = json.loads(request.content)["jobs"]
+        for job in jobs:
+            if "test_code" in job:
+                sources[job["test_hash"]] = job["test_code"]
+        if any(job.get("test_hash") not in sources for job in jobs):
+            return httpx.Response(409, json={"detail": "Unknown test_hash"})
+        batches.append(jobs)
+        if during_batch is not None:
+            during_batch()
+        results = [
+            {"stdout": "42\nTests passed\n", "stderr": "", "returncode": 0, "error": None, "linter_output": ""}
+            if job["user_code"] == "print(42)" else
+            {"stdout": "", "stderr": "AssertionError", "returncode": 1, "error": None, "linter_output": ""}
+            for job in jobs
+        ]
+        return httpx.Response(200, json={"results": results})
+
+    return httpx.MockTransport(handler)
+
+def _admin_headers(client, session, email):
+    client.post("/signup/", json={"email": email, "password": "adminpassword", "name": "Admin"})
+    session.query(models.User).filter(models.User.email == email).update({"is_admin": True})
+    session.commit()
+    return {"Authorization": "Bearer " + client.post("/token", data={"username": email, "password": "adminpassword"}).json()["access_token"]}
+
+# Test lesson validation through one executor batch
+@pytest.mark.asyncio
+async def test_validate_lessons_runs_examples_in_a_batch(client, session, monkeypatch):
+    import httpx
+    import main
+    from executor_client import ExecutorPool
+
+    batches = []
+    pool = ExecutorPool(["http://executor"], health_interval=0)
+    pool._client = httpx.AsyncClient(transport=_fake_batch_executor(batches))
+    monkeypatch.setattr(main, "executor_pool", pool)
+    headers = _admin_headers(client, session, "validate@example.com")
+    good = models.Lesson(title="Good", content="...", code_example="print(42)", test_code="assert user_printed_output == '42\\n'\nprint('Tests passed')")
+    broken = models.Lesson(title="Broken", content="...", code_example="print(41)", test_code="assert False")
+    session.add_all([good, broken, models.Lesson(title="No tests", content="...", code_example="print(1)")])
+    session.commit()
+
+    response = client.post("/lessons/validate", headers=headers)
+    assert response.status_code == 200
+    assert [(row["title"], row["status"]) for row in response.json()] == [("Good", "success"), ("Broken", "attempted")]
+    assert len(batches) == 1 and all("test_hash" in job for job in batches[0])
+
+# Test that regrading chunks batches and keeps attempts saved meanwhile
+@pytest.mark.asyncio
+async def test_regrade_lesson_chunks_batches_and_keeps_newer_attempts(client, session, monkeypatch):
+    import httpx
+    import main
+    from executor_client import ExecutorPool
+
+    headers = _admin_headers(client, session, "regrade@example.com")
+    lesson = models.Lesson(title="Regrade", content="...", test_code="assert user_printed_output == '42\\n'\nprint('Tests passed')")
+    session.add(lesson)
+    users = [models.User(email=f"regrade{i}@example.com", hashed_password="x") for i in range(4)]
+    session.add_all(users)
+    session.commit()
+    for user, code, status in zip(users, ("print(42)", "print(42)", "print(41)", "print(41)"), ("attempted", "attempted", "attempted", "completed")):
+        session.add(models.UserLessonCompletion(user_id=user.id, lesson_id=lesson.id, last_attempted_code=code, status=status))
+    session.commit()
+
+    def attempt_saved_meanwhile():
+        if len(batches) == 1: # users[0] runs new code while the first batch is being graded
+            session.query(models.UserLessonCompletion).filter_by(user_id=users[0].id).update({"last_attempted_code": "print(0)", "status": "error"})
+            session.commit()
+
+    batches = []
+    pool = ExecutorPool(["http://executor"], health_interval=0)
+    pool._client = httpx.AsyncClient(transport=_fake_batch_executor(batches, attempt_saved_meanwhile))
+    monkeypatch.setattr(main, "executor_pool", pool)
+    monkeypatch.setattr(main, "CODE_EXECUTOR_MAX_BATCH_SIZE", 2)
+
+    response = client.post(f"/lessons/{lesson.id}/regrade", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"lesson_id": lesson.id, "regraded": 3, "changed": 1, "succeeded": 1}
+    assert [len(jobs) for jobs in batches] == [2, 1]
+    assert sum("test_code" in job for jobs in batches for job in jobs) == 1 # Sent once, then by hash
+
+    session.expire_all()
+    statuses = {row.user_id: (row.status, row.last_attempted_code) for row in session.query(models.UserLessonCompletion)}
+    assert statuses == {
+        users[0].id: ("error", "print(0)"),
+        users[1].id: ("success", "print(42)"),
+        users[2].id: ("attempted", "print(41)"),
+        users[3].id: ("completed", "print(41)"), # Marked complete by hand: not regraded
+    }
+    assert client.post("/lessons/999/regrade", headers=headers).status_code == 404
+
+@pytest.mark.asyncio
+async def test_executor_client_closed_after_jobs_finish(client, session, monkeypatch):
+    import asyncio
+    import httpx
+    import main
+    from executor_client import ExecutorPool, NoExecutorAvailable
+
+    async def slow_executor(request):
+        await asyncio.sleep(0.3) # Still running when shutdown starts
+        return httpx.Response(200, json={"stdout": "Hello\nTests passed\n", "stderr": "", "returncode": 0, "error": None, "linter_output": ""})
+
+    pool = ExecutorPool(["http://executor"], health_interval=0)
+    pool._client = httpx.AsyncClient(transport=httpx.MockTransport(slow_executor))
+    monkeypatch.setattr(main, "executor_pool", pool)
+    lesson = models.Lesson(title="Shutdown lesson", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "shutdown@example.com", "password": "password", "name": "Shutdown"})
+    token = client.post("/token", data={"username": "shutdown@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    job_id = client.post("/execute-code/jobs", json={"lesson_id": lesson.id, "code": "print('Hello')"}, headers=headers).json()["job_id"]
+
+    async def shut_down():
+        for hook in app.router.on_shutdown:
+            if hook.__name__ != "stop_password_hasher": # Shared by the tests that follow
+                await hook()
+
+    client.portal.call(shut_down)
+    # The job finished on the shared client, which was only closed afterwards
+    job = client.get(f"/execute-code/jobs/{job_id}", headers=headers).json()
+    assert job["status"] == "done" and job["result"]["status"] == "success"
+    assert pool._client is None
+    with pytest.raises(NoExecutorAvailable):
+        client.portal.call(pool.post, "/execute")
+
+# Test that endpoints work with the lean principal
+@pytest.mark.asyncio
+async def test_lean_principal_serves_user_fields_and_completions(client, session):
+    import auth
+
+    lesson = models.Lesson(title="Principal lesson", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "lean@example.com", "password": "password", "name": "Lean"})
+    token = client.post("/token", data={"username": "lean@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = session.query(models.User).filter(models.User.email == "lean@example.com").one().id
+    session.add(models.UserLessonCompletion(user_id=user_id, lesson_id=lesson.id, status="completed", bookmarked=True, last_attempted_code="print(1)"))
+    session.commit()
+
+    me = client.get("/users/me/", headers=headers).json()
+    # Endpoints see a Principal, not an ORM user with its completions loaded
+    principal = auth.principal_cache.get(token)
+    assert isinstance(principal, auth.Principal) and not hasattr(principal, "lesson_completions")
+    assert (principal.id, principal.email, principal.name, principal.is_admin) == (user_id, "lean@example.com", "Lean", False)
+
+    assert (me["id"], me["email"], me["name"], me["is_active"], me["is_admin"]) == (user_id, "lean@example.com", "Lean", True, False)
+    assert [completion["lesson_id"] for completion in me["lesson_completions"]] == [lesson.id]
+    assert [row["lesson_id"] for row in client.get("/users/me/lesson-completions", headers=headers).json()] == [lesson.id]
+    assert client.get(f"/users/me/lessons/{lesson.id}/code", headers=headers).json()["last_attempted_code"] == "print(1)"
+    assert [row["id"] for row in client.get("/users/me/lessons/bookmarked", headers=headers).json()] == [lesson.id]
+    assert client.get("/users/", headers=headers).status_code == 403 # is_admin comes from the principal
+
+# Test that flush_user waits for a flush already writing the user's rows
+@pytest.mark.asyncio
+async def test_progress_flush_user_waits_for_flush_in_progress(client, session, monkeypatch):
+    import asyncio
+    import main
+    from completions import ProgressWriter
+
+    lesson = models.Lesson(title="In flight", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "inflight@example.com", "password": "password", "name": "In flight"})
+    user_id = session.query(models.User).filter(models.User.email == "inflight@example.com").one().id
+
+    writer = ProgressWriter(main._background_session, flush_interval=60, max_pending=100)
+    write = writer._write
+
+    async def slow_write(db, rows):
+        await asyncio.sleep(0.3)
+        await write(db, rows)
+
+    monkeypatch.setattr(writer, "_write", slow_write)
+
+    async def flush_user_during_flush():
+        await writer.record(user_id, lesson.id, "print(1)", "attempted")
+        flush = asyncio.ensure_future(writer.flush())
+        await asyncio.sleep(0.1) # The row has left the buffer but isn't committed yet
+        await writer.flush_user(user_id)
+        written = flush.done()
+        await flush
+        return written
+
+    assert client.portal.call(flush_user_during_flush)
+    assert session.query(models.UserLessonCompletion).filter_by(user_id=user_id).one().last_attempted_code == "print(1)"
+
+# Test that a queued attempt from another process doesn't overwrite a newer direct write
+@pytest.mark.asyncio
+async def test_progress_flush_keeps_newer_direct_write(client, session):
+    import main
+    from completions import ProgressWriter
+
+    lesson = models.Lesson(title="Two processes", content="...")
+    session.add(lesson)
+    session.commit()
+    client.post("/signup/", json={"email": "twoprocs@example.com", "password": "password", "name": "Two"})
+    token = client.post("/token", data={"username": "twoprocs@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = session.query(models.User).filter(models.User.email == "twoprocs@example.com").one().id
+
+    other_process = ProgressWriter(main._background_session, flush_interval=60, max_pending=100)
+    client.portal.call(other_process.record, user_id, lesson.id, "print('stale')", "attempted")
+    # This process's writer has nothing queued for the user, so the direct write goes straight through
+    response = client.put(f"/lessons/{lesson.id}/completion", json={"user_id": user_id, "lesson_id": lesson.id, "status": "completed", "last_attempted_code": "print('saved')"}, headers=headers)
+    assert response.status_code == 200
+    client.portal.call(other_process.flush)
+
+    completion = session.query(models.UserLessonCompletion).filter_by(user_id=user_id, lesson_id=lesson.id).one()
+    assert (completion.status, completion.last_attempted_code) == ("completed", "print('saved')")
+
+    # A newer attempt is still written
+    client.portal.call(other_process.record, user_id, lesson.id, "print('newer')", "attempted")
+    client.portal.call(other_process.flush)
+    session.expire_all()
+    assert session.query(models.UserLessonCompletion).filter_by(user_id=user_id, lesson_id=lesson.id).one().last_attempted_code == "print('newer')"
+
+# Test that runs for a lesson that doesn't exist are rejected
+@pytest.mark.asyncio
+async def test_execute_code_for_unknown_lesson_is_404(client, session, monkeypatch):
+    import main
+    from executor_client import ExecutorNode
+
+    async def fake_run_on_executor(request):
+        raise AssertionError("Nothing should run for a lesson that doesn't exist")
+
+    monkeypatch.setattr(main, "_run_on_executor", fake_run_on_executor)
+    monkeypatch.setattr(main.executor_pool, "nodes", [ExecutorNode("http://executor")])
+    client.post("/signup/", json={"email": "nolesson@example.com", "password": "password", "name": "No lesson"})
+    token = client.post("/token", data={"username": "nolesson@example.com", "password": "password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for path in ("/execute-code/", "/execute-code/stream", "/execute-code/jobs"):
+        response = client.post(path, json={"lesson_id": 99999, "code": "print(1)"}, headers=headers)
+        assert response.status_code == 404
+    assert main.progress_writer.stats()["pending"] == 0
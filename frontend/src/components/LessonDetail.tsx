@@ -139,7 +139,7 @@ const LessonDetail: React.FC = () => {
     setExerciseOutput('Running exercise code...');
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/execute-code/`, {
+      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/execute-code/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -153,12 +153,46 @@ const LessonDetail: React.FC = () => {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         const errorData = await response.json();
         throw new Error(errorData.detail || 'Failed to execute code');
       }
 
-      const result = await response.json();
+      // Read the Server-Sent Events: output chunks as they are printed, then the graded result
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamedOutput = '';
+      let streamedError = '';
+      let result: any = null;
+      setExerciseOutput('');
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
+          const eventType = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] || '{}');
+          if (eventType === 'stdout') {
+            streamedOutput += data.data;
+            setExerciseOutput(streamedOutput);
+          } else if (eventType === 'stderr') {
+            streamedError += data.data;
+            setExerciseError(streamedError);
+          } else if (eventType === 'result') {
+            result = { ...data, output: streamedOutput };
+          } else if (eventType === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
+      if (!result) {
+        throw new Error('Code execution ended without a result');
+      }
       setExerciseOutput(result.output);
       setLinterFeedback(result.linter_output || null); // Set linter feedback
       if (result.error) {
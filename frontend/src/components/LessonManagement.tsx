@@ -16,8 +16,13 @@ const LessonManagement: React.FC = () => {
   const [lessons, setLessons] = useState<Lesson[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const [pageCursors, setPageCursors] = useState<(string | null)[]>([null]); // Cursor of every page visited so far
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const navigate = useNavigate();
 
+  const PAGE_SIZE = 50;
+  const currentCursor = pageCursors[pageCursors.length - 1];
+
   const fetchLessons = async () => {
     setLoading(true);
     setGlobalLoading(true);
@@ -33,7 +38,10 @@ const LessonManagement: React.FC = () => {
     }
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/lessons/`, {
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+      if (currentCursor) params.set('cursor', currentCursor);
+
+      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/lessons/?${params}`, {
         headers: {
           'Authorization': `${tokenType} ${token}`,
         },
@@ -46,6 +54,7 @@ const LessonManagement: React.FC = () => {
 
       const data: Lesson[] = await response.json();
       setLessons(data);
+      setNextCursor(response.headers.get('X-Next-Cursor'));
     } catch (err: any) {
       setGlobalAlert(`Error fetching lessons: ${err.message}`, "danger");
       setError(err.message);
@@ -65,7 +74,7 @@ const LessonManagement: React.FC = () => {
       setGlobalAlert('Please log in to view this page.', "warning");
       navigate('/login');
     }
-  }, [isLoggedIn, isAdmin, navigate, setGlobalAlert, setGlobalLoading]);
+  }, [isLoggedIn, isAdmin, navigate, setGlobalAlert, setGlobalLoading, currentCursor]);
 
   const handleDeleteLesson = async (lessonId: number) => {
     if (!window.confirm('Are you sure you want to delete this lesson? This action cannot be undone.')) {
@@ -153,6 +162,11 @@ const LessonManagement: React.FC = () => {
           )}
         </tbody>
       </table>
+      <div className="d-flex justify-content-between mb-4">
+        <button className="btn btn-outline-secondary" disabled={pageCursors.length <= 1} onClick={() => setPageCursors(pageCursors.slice(0, -1))}>Previous</button>
+        <span className="align-self-center">Page {pageCursors.length}</span>
+        <button className="btn btn-outline-secondary" disabled={!nextCursor} onClick={() => setPageCursors([...pageCursors, nextCursor])}>Next</button>
+      </div>
     </div>
   );
 };
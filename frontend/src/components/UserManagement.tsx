@@ -13,10 +13,17 @@ const UserManagement: React.FC = () => {
   const { isLoggedIn, isAdmin } = useAuth();
   const [users, setUsers] = useState<User[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
+  const [loaded, setLoaded] = useState<boolean>(false); // After the first page, keep the table (and search box) up while paging
   const [error, setError] = useState<string | null>(null);
   const [editingUser, setEditingUser] = useState<User | null>(null);
   const [showEditModal, setShowEditModal] = useState<boolean>(false);
   const [searchTerm, setSearchTerm] = useState<string>(''); // New state for search term
+  const [roleFilter, setRoleFilter] = useState<string>(''); // '', 'admin', 'user', 'inactive'
+  const [pageCursors, setPageCursors] = useState<(string | null)[]>([null]); // Cursor of every page visited so far
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+  const PAGE_SIZE = 50;
+  const currentCursor = pageCursors[pageCursors.length - 1];
 
   const fetchUsers = async () => {
     setLoading(true);
@@ -31,7 +38,14 @@ const UserManagement: React.FC = () => {
     }
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/users/`, {
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE), order_by: 'email' });
+      if (currentCursor) params.set('cursor', currentCursor);
+      if (searchTerm) params.set('search', searchTerm);
+      if (roleFilter === 'admin') params.set('is_admin', 'true');
+      if (roleFilter === 'user') params.set('is_admin', 'false');
+      if (roleFilter === 'inactive') params.set('is_active', 'false');
+
+      const response = await fetch(`${import.meta.env.VITE_API_BASE_URL}/users/?${params}`, {
         headers: {
           'Authorization': `${tokenType} ${token}`,
         },
@@ -44,21 +58,35 @@ const UserManagement: React.FC = () => {
 
       const data: User[] = await response.json();
       setUsers(data);
+      setNextCursor(response.headers.get('X-Next-Cursor'));
     } catch (err: any) {
       setError(err.message);
     } finally {
       setLoading(false);
+      setLoaded(true);
     }
   };
 
   useEffect(() => {
     if (isLoggedIn && isAdmin) {
-      fetchUsers();
+      const timer = setTimeout(fetchUsers, 300); // Wait for typing in the search box to pause
+      return () => clearTimeout(timer);
     } else if (!isAdmin) {
       setError('You do not have administrative privileges to view this page.');
       setLoading(false);
     }
-  }, [isLoggedIn, isAdmin]);
+  }, [isLoggedIn, isAdmin, searchTerm, roleFilter, currentCursor]);
+
+  // Filters apply from the first page
+  const handleSearchChange = (value: string) => {
+    setSearchTerm(value);
+    setPageCursors([null]);
+  };
+
+  const handleRoleFilterChange = (value: string) => {
+    setRoleFilter(value);
+    setPageCursors([null]);
+  };
 
   const handleEditClick = (user: User) => {
     setEditingUser({ ...user }); // Create a copy to edit
@@ -131,16 +159,11 @@ const UserManagement: React.FC = () => {
     }
   };
 
-  const filteredUsers = users.filter(user =>
-    user.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    (user.name && user.name.toLowerCase().includes(searchTerm.toLowerCase()))
-  );
-
   if (!isLoggedIn) {
     return <div className="alert alert-warning mt-4">Please log in to view this page.</div>;
   }
 
-  if (loading) {
+  if (loading && !loaded) {
     return (
       <div className="d-flex justify-content-center mt-5">
         <div className="spinner-border text-primary" role="status">
@@ -157,14 +180,24 @@ const UserManagement: React.FC = () => {
   return (
     <div className="container mt-4">
       <h1>User Management</h1>
-      <div className="mb-3">
-        <input
-          type="text"
-          className="form-control"
-          placeholder="Search by email or name..."
-          value={searchTerm}
-          onChange={(e) => setSearchTerm(e.target.value)}
-        />
+      <div className="row g-2 mb-3">
+        <div className="col">
+          <input
+            type="text"
+            className="form-control"
+            placeholder="Search by email or name..."
+            value={searchTerm}
+            onChange={(e) => handleSearchChange(e.target.value)}
+          />
+        </div>
+        <div className="col-auto">
+          <select className="form-select" value={roleFilter} onChange={(e) => handleRoleFilterChange(e.target.value)}>
+            <option value="">All users</option>
+            <option value="admin">Admins</option>
+            <option value="user">Non-admins</option>
+            <option value="inactive">Inactive</option>
+          </select>
+        </div>
       </div>
       <table className="table table-striped">
         <thead>
@@ -178,8 +211,8 @@ const UserManagement: React.FC = () => {
           </tr>
         </thead>
         <tbody>
-          {filteredUsers.length > 0 ? (
-            filteredUsers.map(user => (
+          {users.length > 0 ? (
+            users.map(user => (
               <tr key={user.id}>
                 <td>{user.id}</td>
                 <td>{user.email}</td>
@@ -199,6 +232,11 @@ const UserManagement: React.FC = () => {
           )}
         </tbody>
       </table>
+      <div className="d-flex justify-content-between mb-4">
+        <button className="btn btn-outline-secondary" disabled={pageCursors.length <= 1} onClick={() => setPageCursors(pageCursors.slice(0, -1))}>Previous</button>
+        <span className="align-self-center">Page {pageCursors.length}</span>
+        <button className="btn btn-outline-secondary" disabled={!nextCursor} onClick={() => setPageCursors([...pageCursors, nextCursor])}>Next</button>
+      </div>
 
       {/* Edit User Modal */}
       {showEditModal && editingUser && (